@@ -1,5 +1,12 @@
-from flask import Flask, request, jsonify
-from reviews_fetcher import ReviewsFetcher, SortBy
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from reviews_fetcher import ReviewsFetcher, SortBy, place_url
+from scraper_pool import ScraperPool
+from review_cache import ReviewCache
+from request_coalescer import RequestCoalescer
+from review_store import ORDER_BY, ReviewStore
+from serializers import dumps_review, dumps_reviews_response, parse_fields, review_to_dict
+from jobs import JobManager, QueueFullError
+from scrapers.metrics import REGISTRY, RETRIES_TOTAL, Histogram
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 from logging.handlers import RotatingFileHandler
@@ -7,6 +14,8 @@ import os
 import time
 import signal
 import sys
+import threading
+import atexit
 from datetime import datetime
 
 app = Flask(__name__)
@@ -25,6 +34,123 @@ app.logger.addHandler(file_handler)
 app.logger.setLevel(logging.INFO)
 app.logger.info('Google Maps Reviews Scraper startup')
 
+# Scraper backend: 'selenium' (headless Chrome) or 'http' (browserless, only
+# what the review list responses carry)
+SCRAPER_BACKEND = os.environ.get('SCRAPER_BACKEND', 'selenium')
+
+# Warm pool of Chrome scrapers. Each gunicorn worker imports this module on its
+# own (do not run gunicorn with --preload), so every worker gets its own pool.
+# SCRAPER_POOL_SIZE=0 disables pooling and launches a browser per request.
+SCRAPER_POOL_SIZE = int(os.environ.get('SCRAPER_POOL_SIZE', 2)) \
+    if SCRAPER_BACKEND == 'selenium' else 0
+SCRAPER_MAX_USES = int(os.environ.get('SCRAPER_MAX_USES', 50))
+SCRAPER_MAX_AGE = float(os.environ.get('SCRAPER_MAX_AGE', 1800))
+SCRAPER_ACQUIRE_TIMEOUT = float(os.environ.get('SCRAPER_ACQUIRE_TIMEOUT', 60))
+# Opt-in: skip images, fonts, media and map tiles in the headless browser,
+# decode reviews from the review page responses instead of the DOM, and save
+# every scrape as a session archive in SCRAPER_RECORD_TO for offline replay.
+# SCRAPER_PRUNE_DOM empties review blocks once read, for long scrapes.
+# New browsers start from a profile with the cookie consent already given.
+SCRAPER_OPTIONS = {
+    'block_resources': os.environ.get('SCRAPER_BLOCK_RESOURCES', '0') in ('1', 'true'),
+    'capture_network': os.environ.get('SCRAPER_CAPTURE_NETWORK', '0') in ('1', 'true'),
+    'record_to': os.environ.get('SCRAPER_RECORD_TO') or None,
+    'prune_dom': os.environ.get('SCRAPER_PRUNE_DOM', '0') in ('1', 'true'),
+    'profile_template': os.environ.get('SCRAPER_PROFILE_TEMPLATE', '1') in ('1', 'true'),
+} if SCRAPER_BACKEND == 'selenium' else {}
+
+# Batches a request fetches ahead while earlier ones are parsed, 0 scrolls and
+# parses one batch at a time
+SCRAPER_PIPELINE_DEPTH = int(os.environ.get('SCRAPER_PIPELINE_DEPTH', 0))
+
+scraper_pool = None
+if SCRAPER_POOL_SIZE > 0:
+    scraper_pool = ScraperPool(
+        size=SCRAPER_POOL_SIZE,
+        max_uses=SCRAPER_MAX_USES,
+        max_age=SCRAPER_MAX_AGE,
+        acquire_timeout=SCRAPER_ACQUIRE_TIMEOUT,
+        scraper_options=SCRAPER_OPTIONS,
+    )
+    scraper_pool.start()
+    atexit.register(scraper_pool.close)
+
+# Per-worker review cache. NEWEST-sorted requests for a stale entry only
+# scroll until they reach a cached review.
+review_cache = ReviewCache(
+    ttl=float(os.environ.get('REVIEW_CACHE_TTL', 900)),
+    max_stale=float(os.environ.get('REVIEW_CACHE_MAX_STALE', 86400)),
+    max_entries=int(os.environ.get('REVIEW_CACHE_SIZE', 256)),
+)
+
+# Concurrent requests for the same place and sort order share one scrape,
+# requests for fewer reviews join a larger scrape in flight
+review_coalescer = RequestCoalescer()
+
+# Every scraped review is upserted into a SQLite file shared by the gunicorn
+# workers, and /api/reviews reads from it without scraping. An empty
+# REVIEW_STORE_PATH disables the store.
+REVIEW_STORE_PATH = os.environ.get('REVIEW_STORE_PATH', 'reviews.db')
+review_store = ReviewStore(REVIEW_STORE_PATH) if REVIEW_STORE_PATH else None
+
+# Places probed by one /api/place-summary request
+MAX_PROBED_PLACES = int(os.environ.get('MAX_PROBED_PLACES', 50))
+
+# Background scrape jobs, processed by a bounded set of worker threads. Each
+# worker has a browser of its own in job_pool, so a large job never takes
+# the browsers of scraper_pool away from the request handlers. Jobs live in
+# the memory of the gunicorn worker that accepted them.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+job_pool = None
+if scraper_pool:
+    job_pool = ScraperPool(
+        size=JOB_WORKERS,
+        max_uses=SCRAPER_MAX_USES,
+        max_age=SCRAPER_MAX_AGE,
+        acquire_timeout=SCRAPER_ACQUIRE_TIMEOUT,
+        scraper_options=SCRAPER_OPTIONS,
+    )
+    job_pool.start()
+    atexit.register(job_pool.close)
+job_manager = JobManager(
+    n_workers=JOB_WORKERS,
+    max_pending_places=int(os.environ.get('JOB_MAX_PENDING_PLACES', 5000)),
+    result_ttl=float(os.environ.get('JOB_RESULT_TTL', 3600)),
+    pool=job_pool,
+    cache=review_cache,
+    store=review_store,
+    coalescer=review_coalescer,
+    pipeline_depth=SCRAPER_PIPELINE_DEPTH,
+    scraper_options=SCRAPER_OPTIONS,
+    backend=SCRAPER_BACKEND,
+)
+# Under gunicorn shutdown_handler is not installed. atexit handlers run only
+# after the interpreter joined the job threads, which first work through
+# every queued place, so the queue is cancelled just before that join.
+threading._register_atexit(job_manager.shutdown)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'gm_http_request_seconds', 'Time to build the response of an API request.',
+    ['endpoint', 'method', 'status'])
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    # Streamed responses are observed when their first line is ready
+    start = g.pop('request_start', None)
+    if start is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            endpoint=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=response.status_code)
+    return response
+
 # Global error handlers
 
 
@@ -38,12 +164,88 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 
+def _store_reviews(url, reviews):
+    """Upsert scraped reviews, a store failure must not fail the request."""
+    if not review_store or not reviews:
+        return
+    try:
+        review_store.upsert(url, reviews)
+    except Exception as e:
+        app.logger.error(f'Error storing reviews: {str(e)}')
+
+
+def _scrape_reviews(url, max_reviews):
+    """One scrape attempt, shared by the concurrent requests for the place."""
+    with ReviewsFetcher(debug=False, pool=scraper_pool,
+                        cache=review_cache,
+                        scraper_options=SCRAPER_OPTIONS,
+                        backend=SCRAPER_BACKEND,
+                        pipeline_depth=SCRAPER_PIPELINE_DEPTH) as scraper:
+        reviews = scraper.get_reviews(
+            url=url,
+            sort_by=SortBy.NEWEST,
+            max_reviews=max_reviews
+        )
+    _store_reviews(url, reviews)
+    return reviews
+
+
+def _stream_reviews(url, max_reviews, fields=None, max_retries=3):
+    """Yield one NDJSON line per review as soon as it is scraped.
+
+    Retries are only possible until the first review has been sent; after
+    that a failure is reported as a final error line.
+    """
+    sent = 0
+    retry_count = 0
+    streamed = []
+
+    while True:
+        try:
+            with ReviewsFetcher(debug=False, pool=scraper_pool,
+                                scraper_options=SCRAPER_OPTIONS,
+                                backend=SCRAPER_BACKEND,
+                                pipeline_depth=SCRAPER_PIPELINE_DEPTH) as scraper:
+                for review in scraper.iter_reviews(
+                        url=url,
+                        sort_by=SortBy.NEWEST,
+                        max_reviews=max_reviews):
+                    sent += 1
+                    streamed.append(review)
+                    yield dumps_review(review, fields) + '\n'
+            app.logger.info(f'Successfully streamed {sent} reviews')
+            _store_reviews(url, streamed)
+            return
+
+        except Exception as e:
+            retry_count += 1
+            app.logger.error(
+                f'Error streaming reviews (attempt {retry_count}/{max_retries}): {str(e)}')
+
+            if sent or retry_count == max_retries:
+                _store_reviews(url, streamed)
+                yield app.json.dumps({
+                    'success': False,
+                    'error': f'Failed to fetch reviews after {sent} reviews. Last error: {str(e)}'
+                }) + '\n'
+                return
+
+            RETRIES_TOTAL.inc(operation='request')
+
+            time.sleep(2 * retry_count)
+
+
 @app.route('/api/fetch-reviews', methods=['GET'])
 def fetch_reviews():
     try:
         # Get parameters from the request
         place_id = request.args.get('place_id')
         max_reviews = request.args.get('max_reviews', default=10, type=int)
+        stream = request.args.get('stream', default='0') in ('1', 'true')
+        try:
+            fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # Input validation
         if not place_id:
@@ -55,7 +257,12 @@ def fetch_reviews():
             f'Fetching reviews for place_id: {place_id}, max_reviews: {max_reviews}')
 
         # Construct the URL
-        url = f"https://www.google.com/maps/place/?q=place_id:{place_id}"
+        url = place_url(place_id)
+
+        if stream:
+            return Response(
+                stream_with_context(_stream_reviews(url, max_reviews, fields)),
+                mimetype='application/x-ndjson')
 
         # Fetch reviews using the scraper with retries
         max_retries = 3
@@ -64,41 +271,15 @@ def fetch_reviews():
 
         while retry_count < max_retries:
             try:
-                with ReviewsFetcher(debug=False) as scraper:
-                    reviews = scraper.get_reviews(
-                        url=url,
-                        sort_by=SortBy.NEWEST,
-                        max_reviews=max_reviews
-                    )
-
-                    # Convert reviews to dictionary format
-                    reviews_data = []
-                    for review in reviews:
-                        reviews_data.append({
-                            'id': review.id_review,
-                            'content': review.content,
-                            'submitted_at': review.submitted_at,
-                            'rating': review.rating,
-                            'username': review.username,
-                            'avatar': review.avatar,
-                            'reply_content': review.reply_content,
-                            'reply_date': review.reply_date,
-                            'n_review_user': review.n_review_user,
-                            'url_user': review.url_user,
-                        })
-
-                    review_with_text = [
-                        review for review in reviews_data if review['content'] is not None]
-
-                    app.logger.info(
-                        f'Successfully fetched {len(reviews_data)} reviews')
-                    return jsonify({
-                        'success': True,
-                        'total_reviews': len(reviews_data),
-                        'reviews': reviews_data,
-                        'total_review_with_text': len(review_with_text),
-                        'review_with_text': review_with_text
-                    })
+                reviews = review_coalescer.do(
+                    (url, SortBy.NEWEST.name), max_reviews,
+                    lambda: _scrape_reviews(url, max_reviews))
+
+                app.logger.info(
+                    f'Successfully fetched {len(reviews)} reviews')
+                return Response(
+                    dumps_reviews_response(reviews, fields),
+                    mimetype='application/json')
 
             except Exception as e:
                 retry_count += 1
@@ -115,6 +296,7 @@ def fetch_reviews():
                     }), 500
 
                 # Wait before retrying
+                RETRIES_TOTAL.inc(operation='request')
                 time.sleep(2 * retry_count)  # Exponential backoff
 
         return jsonify({
@@ -129,6 +311,182 @@ def fetch_reviews():
             'error': 'An unexpected error occurred while processing the request'
         }), 500
 
+
+@app.route('/api/reviews', methods=['GET'])
+def list_reviews():
+    """Stored reviews, filtered and paginated. Never scrapes."""
+    if review_store is None:
+        return jsonify({'error': 'The review store is disabled'}), 404
+
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        since = request.args.get('since')
+        until = request.args.get('until')
+        since = datetime.fromisoformat(since) if since else None
+        until = datetime.fromisoformat(until) if until else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    place_id = request.args.get('place_id')
+    min_rating = request.args.get('min_rating', type=float)
+    max_rating = request.args.get('max_rating', type=float)
+    sort = request.args.get('sort', default='newest')
+    limit = request.args.get('limit', default=100, type=int)
+    offset = request.args.get('offset', default=0, type=int)
+
+    # Input validation
+    if sort not in ORDER_BY:
+        return jsonify({'error': f'sort must be one of {list(ORDER_BY)}'}), 400
+    if limit < 1 or limit > 1000:
+        return jsonify({'error': 'limit must be between 1 and 1000'}), 400
+    if offset < 0:
+        return jsonify({'error': 'offset must not be negative'}), 400
+
+    try:
+        reviews, total = review_store.query(
+            place=place_url(place_id) if place_id else None,
+            min_rating=min_rating,
+            max_rating=max_rating,
+            since=since,
+            until=until,
+            order=sort,
+            limit=limit,
+            offset=offset)
+    except Exception as e:
+        app.logger.error(f'Unexpected error in list_reviews: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'An unexpected error occurred while processing the request'
+        }), 500
+
+    return jsonify({
+        'success': True,
+        'total': total,
+        'limit': limit,
+        'offset': offset,
+        'reviews': [review_to_dict(review, fields) for review in reviews]
+    }), 200
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    try:
+        payload = request.get_json(silent=True) or {}
+        place_ids = payload.get('place_ids')
+        max_reviews = payload.get('max_reviews', 10)
+        sort_by = payload.get('sort_by', SortBy.NEWEST.name)
+        only_changed = payload.get('only_changed', False)
+
+        # Input validation
+        if not isinstance(place_ids, list) or not place_ids or \
+                not all(isinstance(place_id, str) and place_id for place_id in place_ids):
+            return jsonify({'error': 'place_ids must be a non-empty list of strings'}), 400
+        # bool is an int subclass, true would be taken as 1
+        if not isinstance(max_reviews, int) or isinstance(max_reviews, bool) \
+                or max_reviews < 1 or max_reviews > 1000:
+            return jsonify({'error': 'max_reviews must be between 1 and 1000'}), 400
+        if sort_by not in SortBy.__members__:
+            return jsonify({'error': f'sort_by must be one of {list(SortBy.__members__)}'}), 400
+        if not isinstance(only_changed, bool):
+            return jsonify({'error': 'only_changed must be a boolean'}), 400
+        if only_changed and not review_store:
+            return jsonify({'error': 'only_changed needs the review store'}), 400
+        if only_changed and SCRAPER_BACKEND != 'selenium':
+            # Changes are told by the place header, which only a browser reads
+            return jsonify({'error': 'only_changed needs the selenium backend'}), 400
+        if only_changed and sort_by != SortBy.NEWEST.name:
+            return jsonify({'error': 'only_changed needs sort_by NEWEST'}), 400
+
+        job = job_manager.submit(
+            place_ids, sort_by=SortBy[sort_by], max_reviews=max_reviews,
+            only_changed=only_changed)
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status.value,
+            'total_places': len(job.place_ids)
+        }), 202
+
+    except QueueFullError as e:
+        app.logger.warning(f'Rejected job: {str(e)}')
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except Exception as e:
+        app.logger.error(f'Unexpected error in create_job: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'An unexpected error occurred while processing the request'
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    include_results = request.args.get('results', default='1') in ('1', 'true')
+    response = {
+        'success': True,
+        'job_id': job.id,
+        'status': job.status.value,
+        'total_places': len(job.place_ids),
+        'completed_places': job.completed,
+        'failed_places': len(job.errors),
+        'errors': dict(job.errors),
+        'unchanged_places': list(job.unchanged),
+    }
+    if include_results:
+        response['results'] = {
+            place_id: [review_to_dict(review) for review in reviews]
+            for place_id, reviews in list(job.results.items())
+        }
+    return jsonify(response), 200
+
+
+@app.route('/api/place-summary', methods=['GET'])
+def place_summary():
+    """Name, rating and review count of places, read from their header
+    without scraping reviews. All places are probed in one browser."""
+    place_ids = [place_id for place_id in request.args.get('place_ids', '').split(',')
+                 if place_id]
+
+    if SCRAPER_BACKEND != 'selenium':
+        return jsonify({'error': 'Place summaries need the selenium backend'}), 501
+
+    # Input validation
+    if not place_ids:
+        return jsonify({'error': 'place_ids is required'}), 400
+    if len(place_ids) > MAX_PROBED_PLACES:
+        return jsonify({'error': f'At most {MAX_PROBED_PLACES} place_ids per request'}), 400
+
+    try:
+        with ReviewsFetcher(debug=False, pool=scraper_pool,
+                            scraper_options=SCRAPER_OPTIONS,
+                            backend=SCRAPER_BACKEND) as scraper:
+            places = {}
+            for place_id, (_, metadata) in zip(place_ids, scraper.get_place_metadata_many(
+                    [place_url(place_id) for place_id in place_ids],
+                    return_exceptions=True)):
+                if isinstance(metadata, Exception):
+                    places[place_id] = {'success': False, 'error': str(metadata)}
+                else:
+                    places[place_id] = dict(metadata, success=True)
+    except Exception as e:
+        app.logger.error(f'Unexpected error in place_summary: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'An unexpected error occurred while processing the request'
+        }), 500
+
+    return jsonify({'success': True, 'places': places}), 200
+
+# Prometheus scrape endpoint, metrics of this worker process
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 # Add a health check endpoint
 
 
@@ -144,7 +502,13 @@ def health_check():
 
 def shutdown_handler(signum, frame):
     app.logger.info('Received shutdown signal, cleaning up...')
-    # Add any cleanup code here if needed
+    job_manager.shutdown()
+    if job_pool:
+        job_pool.close()
+    if scraper_pool:
+        scraper_pool.close()
+    if review_store:
+        review_store.close()
     sys.exit(0)
 
 
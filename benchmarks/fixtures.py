@@ -0,0 +1,104 @@
+# fixtures.py
+"""Review-pane fixtures built from a review block recorded from Google Maps.
+
+review_block.html is a single review block as served in the Maps review
+pane. Fixtures of any size are generated from it, varying the fields that
+the scraper reads, so the parsers see the same markup they see live.
+"""
+import os
+from string import Template
+from scrapers.review_parsers import BeautifulSoupReviewParser
+from scrapers.review_payloads import encode_reviews_payload
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURE_SIZES = (10, 100, 500, 1000, 2000)
+
+RELATIVE_DATES = ['2 hours ago', 'a day ago', '3 days ago', 'a week ago',
+                  '2 weeks ago', 'a month ago', '5 months ago', 'a year ago',
+                  '3 years ago']
+REVIEW_TEXTS = [
+    'Great coffee &amp; friendly staff.&#10;Will come back&nbsp;again!',
+    'Service was slow, but the food made up for it. Prices are fair for the area.',
+    'Πολύ καλό φαγητό και εξαιρετική εξυπηρέτηση.',
+    'Ok.',
+]
+TEXT_TEMPLATE = Template(
+    '<div class="MyEned" lang="en" id="$id_review-text"><span class="wiI7pd">$text</span>'
+    '<button class="w8nwRe kyuRq" aria-expanded="false" jsaction="pane.review.expandReview">More</button></div>')
+REPLY_TEMPLATE = Template(
+    '<div class="CDe7pd"><div class="s4Gokd"><span class="nM6d2c">Response from the owner</span> '
+    '<span class="DZSIDd">$relative_date</span></div><div class="wiI7pd" lang="el">'
+    'Ευχαριστούμε πολύ για την κριτική σας! &lt;3</div></div>')
+
+with open(os.path.join(FIXTURES_DIR, 'review_block.html'), encoding='utf-8') as f:
+    BLOCK_TEMPLATE = Template(f.read().strip())
+
+
+def make_review_block(index):
+    """Review block number index, deterministic for a given index."""
+    id_review = f'ChZDSUhNMG9nS0VJQ0FnSUQ{index:07d}'
+    has_text = index % 7 != 6
+    has_reply = index % 3 == 0
+    return BLOCK_TEMPLATE.substitute(
+        id_review=id_review,
+        username=f'Reviewer {index}',
+        user_id=f'1090{index:08d}',
+        n_reviews=(index * 37) % 500 + 1,
+        rating=index % 5 + 1,
+        relative_date=RELATIVE_DATES[index % len(RELATIVE_DATES)],
+        text=TEXT_TEMPLATE.substitute(
+            id_review=id_review,
+            text=REVIEW_TEXTS[index % len(REVIEW_TEXTS)]) if has_text else '',
+        reply=REPLY_TEMPLATE.substitute(
+            relative_date=RELATIVE_DATES[(index + 2) % len(RELATIVE_DATES)]) if has_reply else '',
+    )
+
+
+def make_review_blocks(start, count):
+    return [make_review_block(index) for index in range(start, start + count)]
+
+
+def make_review_payload(start, count, n_reviews):
+    """
+    Review page response carrying the same reviews as make_review_blocks.
+
+    The fields are read back from the recorded blocks and written with
+    encode_reviews_payload, so decoding the payload gives exactly what
+    parsing the blocks gives by construction. It does not check FIELD_PATHS
+    against real responses, see review_payloads.
+    """
+    fields = BeautifulSoupReviewParser().parse(make_review_blocks(start, count))
+    next_page_token = f'page-{start + count}' if start + count < n_reviews else None
+    return encode_reviews_payload(fields, next_page_token)
+
+
+def fixture_path(n_reviews):
+    return os.path.join(FIXTURES_DIR, f'review_pane_{n_reviews}.html')
+
+
+def write_fixtures(sizes=FIXTURE_SIZES):
+    """Write a review pane fixture for every size, returns their paths."""
+    paths = []
+    for n_reviews in sizes:
+        path = fixture_path(n_reviews)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('<div class="m6QErb DxyBCb kA9KIf dS8AEf">\n')
+            f.write('\n'.join(make_review_blocks(0, n_reviews)))
+            f.write('\n</div>\n')
+        paths.append(path)
+    return paths
+
+
+def load_review_blocks(n_reviews):
+    """Review blocks of a fixture, written first if it does not exist yet."""
+    path = fixture_path(n_reviews)
+    if not os.path.exists(path):
+        write_fixtures([n_reviews])
+    with open(path, encoding='utf-8') as f:
+        return [line for line in f.read().splitlines()
+                if line.startswith('<div class="jftiEf')]
+
+
+if __name__ == '__main__':
+    for path in write_fixtures():
+        print(path)
@@ -0,0 +1,122 @@
+# memory.py
+"""Memory and time of building a fetch-reviews response.
+
+    python -m benchmarks.memory --sizes 100 1000
+
+Compares the previous response path (dict-backed Review, a dict per review,
+a second filtered list, one json.dumps of the whole payload) with slotted
+Review objects written once by serializers.dumps_reviews_response.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from dataclasses import dataclass, fields as dataclass_fields
+from typing import Optional
+from reviews_fetcher import Review
+from scrapers.google_maps_reviews_scraper import GoogleMapsReviewsScraper
+from scrapers.review_parsers import get_review_parser
+from serializers import dumps_json, dumps_reviews_response
+from .fixtures import load_review_blocks
+from .run import save_results
+
+
+@dataclass
+class LegacyReview:
+    id_review: str
+    content: str
+    submitted_at: str
+    rating: int
+    username: str
+    n_review_user: int
+    avatar: str
+    reply_content: str
+    reply_date: str
+    url_user: str
+    source_url: Optional[str] = None
+
+
+# The fields of the legacy response, so both variants write the same body
+LEGACY_FIELDS = ['id', 'content', 'submitted_at', 'rating', 'username', 'avatar',
+                 'reply_content', 'reply_date', 'n_review_user', 'url_user']
+
+
+def compact_response(reviews):
+    return dumps_reviews_response(reviews, LEGACY_FIELDS)
+
+
+def legacy_response(reviews):
+    reviews_data = []
+    for review in reviews:
+        reviews_data.append({
+            'id': review.id_review,
+            'content': review.content,
+            'submitted_at': review.submitted_at,
+            'rating': review.rating,
+            'username': review.username,
+            'avatar': review.avatar,
+            'reply_content': review.reply_content,
+            'reply_date': review.reply_date,
+            'n_review_user': review.n_review_user,
+            'url_user': review.url_user,
+        })
+    review_with_text = [
+        review for review in reviews_data if review['content'] is not None]
+    # What jsonify wrote
+    return dumps_json({
+        'success': True,
+        'total_reviews': len(reviews_data),
+        'reviews': reviews_data,
+        'total_review_with_text': len(review_with_text),
+        'review_with_text': review_with_text
+    }) + '\n'
+
+
+def load_review_dicts(n_reviews):
+    scraper = object.__new__(GoogleMapsReviewsScraper)
+    return scraper._parse_reviews(get_review_parser().parse(load_review_blocks(n_reviews)))
+
+
+def measure(review_cls, respond, review_dicts):
+    names = [field.name for field in dataclass_fields(review_cls)]
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    reviews = [review_cls(**{name: review_dict.get(name) for name in names})
+               for review_dict in review_dicts]
+    reviews_bytes, _ = tracemalloc.get_traced_memory()
+    body = respond(reviews)
+
+    elapsed = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'reviews_kb': round(reviews_bytes / 1024, 1),
+        'peak_kb': round(peak_bytes / 1024, 1),
+        'elapsed_ms': round(1000 * elapsed, 2),
+        'body_bytes': len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 2000])
+    parser.add_argument('--output', help='JSON file to write, defaults to benchmarks/results/')
+    args = parser.parse_args()
+
+    results = []
+    for n_reviews in args.sizes:
+        review_dicts = load_review_dicts(n_reviews)
+        for name, review_cls, respond in [
+                ('legacy', LegacyReview, legacy_response),
+                ('compact', Review, compact_response)]:
+            result = {'mode': 'memory', 'variant': name, 'n_reviews': n_reviews,
+                      **measure(review_cls, respond, review_dicts)}
+            print(json.dumps(result))
+            results.append(result)
+
+    print(f'Results saved to {save_results(results, args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+# run.py
+"""Offline scraper benchmarks.
+
+    python -m benchmarks.run parse --sizes 10 100 1000 2000
+    python -m benchmarks.run scrape --sizes 100 500 --latency 0.2
+    python -m benchmarks.run scrape --sizes 100 --capture
+    python -m benchmarks.run scrape --sizes 1000 --prune-dom
+    python -m benchmarks.run scrape --sizes 500 --latency 0.2 --pipeline 2
+    python -m benchmarks.run scrape --sizes 100 500 --backend http
+    python -m benchmarks.run replay --archives recordings/*.zip
+    python -m benchmarks.run startup --launches 5
+
+parse runs the review parser backends over the fixtures, with no browser.
+scrape runs ReviewsFetcher with a headless Chrome against the local stand-in
+server, parsing the DOM or, with --capture, decoding the review page
+responses from the network. --prune-dom empties review blocks in the page
+once read, dom_nodes is the page's element count at the end. --pipeline N
+fetches up to N batches ahead while earlier ones are parsed. --backend http
+scrapes with the browserless backend instead, paging through the server's
+listugcposts responses, and checks its reviews match the DOM parse of the
+same review blocks. replay re-runs
+session archives recorded from live scrapes
+(GoogleMapsReviewsScraper(record_to=...)) with no browser, and parses their
+review blocks with each parser. startup launches browsers with an empty
+profile and with the consent profile template, timing the launch and the
+cookie banner handling on the first page. Results are printed and saved as
+JSON for comparison between runs.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+import requests
+from reviews_fetcher import ReviewsFetcher, SortBy
+from scraper_pool import ScraperPool
+from scrapers.google_maps_http_scraper import GoogleMapsHttpScraper
+from scrapers.google_maps_reviews_scraper import GoogleMapsReviewsScraper
+from scrapers.review_parsers import REVIEW_PARSERS, get_review_parser
+from scrapers.session_recording import SessionArchive
+from .fixtures import FIXTURE_SIZES, load_review_blocks, make_review_blocks
+from .server import PAGE_SIZE, start_server
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+class RoundTripCounter:
+    """Counts WebDriver commands sent by a driver, by command name."""
+
+    def __init__(self, driver):
+        self.counts = {}
+        executor = driver.command_executor
+        execute = executor.execute
+
+        def counting_execute(command, params):
+            self.counts[command] = self.counts.get(command, 0) + 1
+            return execute(command, params)
+
+        executor.execute = counting_execute
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+class ParseTimer:
+    """Times every parse() call of a review parser."""
+
+    def __init__(self, parser):
+        self.batch_times = []
+        parse = parser.parse
+
+        def timed_parse(review_blocks):
+            start = time.perf_counter()
+            try:
+                return parse(review_blocks)
+            finally:
+                self.batch_times.append(time.perf_counter() - start)
+
+        parser.parse = timed_parse
+
+
+class RssSampler:
+    """Samples the resident memory of this process and all its descendants
+    (chromedriver and Chrome), keeping the peak. Linux only."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_bytes / 2 ** 20, 1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._tree_rss(os.getpid()))
+            self._stop.wait(self.interval)
+
+    def _tree_rss(self, pid):
+        rss = 0
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                rss = int(f.read().split()[1]) * resource.getpagesize()
+            with open(f'/proc/{pid}/task/{pid}/children') as f:
+                children = [int(child) for child in f.read().split()]
+        except (OSError, ValueError):
+            return rss
+        return rss + sum(self._tree_rss(child) for child in children)
+
+
+def bench_parse(n_reviews, parser_name):
+    blocks = load_review_blocks(n_reviews)
+    parser = get_review_parser(parser_name)
+    timer = ParseTimer(parser)
+
+    start = time.perf_counter()
+    n_parsed = 0
+    for index in range(0, len(blocks), PAGE_SIZE):
+        n_parsed += len(parser.parse(blocks[index:index + PAGE_SIZE]))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'mode': 'parse',
+        'n_reviews': n_parsed,
+        'parser': parser.name,
+        'elapsed_s': round(elapsed, 4),
+        'reviews_per_sec': round(n_parsed / elapsed, 1),
+        'parse_ms_per_batch': round(1000 * sum(timer.batch_times) / len(timer.batch_times), 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def bench_scrape(n_reviews, parser_name, latency, debug=False, capture=False,
+                 prune_dom=False, pipeline_depth=0):
+    server, base_url = start_server(n_reviews=n_reviews, latency=latency)
+    scraper_cls = type('LocalReviewsScraper', (GoogleMapsReviewsScraper,), {
+        'GM_WEBPAGE': f'{base_url}/maps/'})
+    pool = ScraperPool(size=1, scraper_factory=lambda: scraper_cls(
+        debug=debug, parser=parser_name, capture_network=capture, prune_dom=prune_dom))
+
+    try:
+        with RssSampler() as rss:
+            start = time.perf_counter()
+            pool.warm()
+            startup = time.perf_counter() - start
+
+            scraper = pool.acquire()
+            round_trips = RoundTripCounter(scraper.driver)
+            timer = ParseTimer(scraper.parser)
+            pool.release(scraper)
+
+            start = time.perf_counter()
+            with ReviewsFetcher(debug=debug, pool=pool,
+                                pipeline_depth=pipeline_depth) as fetcher:
+                reviews = fetcher.get_reviews(
+                    f'{base_url}/maps/place/?n={n_reviews}', SortBy.NEWEST, n_reviews)
+            elapsed = time.perf_counter() - start
+
+            scraper = pool.acquire()
+            dom_nodes = scraper.driver.execute_script(
+                'return document.getElementsByTagName("*").length;')
+            pool.release(scraper)
+    finally:
+        pool.close()
+        server.shutdown()
+
+    batches = len(timer.batch_times) or 1
+    return {
+        'mode': 'scrape',
+        'n_reviews': len(reviews),
+        'parser': 'network' if capture else scraper.parser.name,
+        'latency_s': latency,
+        'prune_dom': prune_dom,
+        'pipeline_depth': pipeline_depth,
+        'startup_s': round(startup, 3),
+        'elapsed_s': round(elapsed, 3),
+        'reviews_per_sec': round(len(reviews) / elapsed, 1),
+        'batches': len(timer.batch_times),
+        'parse_ms_per_batch': round(1000 * sum(timer.batch_times) / batches, 3),
+        'round_trips': round_trips.total,
+        'dom_nodes': dom_nodes,
+        'round_trips_by_command': round_trips.counts,
+        'peak_rss_mb': rss.peak_mb,
+    }
+
+
+# Review fields compared between backends. Dates are left out, they are
+# estimated against each scrape's own anchor.
+COMPARED_FIELDS = ['id_review', 'content', 'rating', 'username', 'n_review_user',
+                   'avatar', 'reply_content', 'url_user']
+
+
+def dom_reviews(n_reviews):
+    """The review dicts with text a DOM scrape of the stand-in server returns."""
+    scraper = object.__new__(GoogleMapsReviewsScraper)
+    review_dicts = scraper._parse_reviews(
+        get_review_parser().parse(make_review_blocks(0, n_reviews)))
+    return [review for review in review_dicts if review['content'] is not None]
+
+
+def bench_scrape_http(n_reviews, latency, pipeline_depth=0):
+    server, base_url = start_server(n_reviews=n_reviews, latency=latency)
+    session = requests.Session()
+    try:
+        start = time.perf_counter()
+        with ReviewsFetcher(backend=GoogleMapsHttpScraper,
+                            scraper_options={'base_url': base_url, 'session': session},
+                            pipeline_depth=pipeline_depth) as fetcher:
+            reviews = fetcher.get_reviews(
+                f'{base_url}/maps/place/?n={n_reviews}', SortBy.NEWEST, n_reviews)
+            exhausted = fetcher.exhausted
+        elapsed = time.perf_counter() - start
+    finally:
+        session.close()
+        server.shutdown()
+
+    expected = dom_reviews(n_reviews)
+    for index, (review, review_dict) in enumerate(zip(reviews, expected)):
+        for name in COMPARED_FIELDS:
+            if getattr(review, name) != review_dict[name]:
+                raise RuntimeError(
+                    f"http review {index} differs from the DOM parse in {name}: "
+                    f"{getattr(review, name)!r} != {review_dict[name]!r}")
+    if len(reviews) != len(expected):
+        raise RuntimeError(
+            f"http backend returned {len(reviews)} reviews, the DOM parse {len(expected)}")
+
+    return {
+        'mode': 'scrape',
+        'backend': 'http',
+        'n_reviews': len(reviews),
+        'matches_dom': True,
+        'exhausted': exhausted,
+        'latency_s': latency,
+        'pipeline_depth': pipeline_depth,
+        'elapsed_s': round(elapsed, 3),
+        'reviews_per_sec': round(len(reviews) / elapsed, 1),
+    }
+
+
+def bench_startup(n_launches, profile_template, debug=False):
+    server, base_url = start_server(n_reviews=PAGE_SIZE)
+    template_dir = tempfile.mkdtemp(prefix='gm-profile-template-')
+    os.rmdir(template_dir)
+    scraper_cls = type('LocalReviewsScraper', (GoogleMapsReviewsScraper,), {
+        'GM_WEBPAGE': f'{base_url}/maps/', 'PROFILE_TEMPLATE_DIR': template_dir})
+
+    startup_times = []
+    consent_times = []
+    try:
+        for _ in range(n_launches):
+            start = time.perf_counter()
+            scraper = scraper_cls(debug=debug, profile_template=profile_template)
+            startup_times.append(time.perf_counter() - start)
+            try:
+                scraper.driver.get(f'{base_url}/maps/place/?n={PAGE_SIZE}')
+                start = time.perf_counter()
+                scraper._click_on_cookie_agreement()
+                consent_times.append(time.perf_counter() - start)
+            finally:
+                scraper.cleanup()
+    finally:
+        server.shutdown()
+        shutil.rmtree(template_dir, ignore_errors=True)
+
+    # The first launch builds the template
+    later_startups = startup_times[1:] or startup_times
+    return {
+        'mode': 'startup',
+        'profile': 'template' if profile_template else 'empty',
+        'launches': n_launches,
+        'first_startup_s': round(startup_times[0], 3),
+        'startup_s': round(statistics.median(later_startups), 3),
+        'consent_s': round(statistics.median(consent_times), 3),
+        'ready_s': round(statistics.median(later_startups) + statistics.median(consent_times), 3),
+    }
+
+
+def bench_replay(path, parser_name):
+    archive = SessionArchive.load(path)
+    archive.check_replayable()
+    parser = get_review_parser(parser_name)
+    timer = ParseTimer(parser)
+    for index, batch in enumerate(archive.batches):
+        if batch['format'] == 'html':
+            parser.parse(archive.review_blocks(index))
+
+    start = time.perf_counter()
+    batches = GoogleMapsReviewsScraper.replay(path, parser=parser_name)
+    elapsed = time.perf_counter() - start
+    n_reviews = sum(len(batch) for batch in batches)
+
+    return {
+        'mode': 'replay',
+        'archive': os.path.basename(path),
+        'n_reviews': n_reviews,
+        'parser': 'network' if archive.session['capture_network'] else parser.name,
+        'recorded_s': round(sum(command.get('elapsed', 0) for command in archive.commands), 3),
+        'elapsed_s': round(elapsed, 4),
+        'reviews_per_sec': round(n_reviews / elapsed, 1),
+        'batches': len(archive.batches),
+        'parse_ms_per_batch': round(
+            1000 * sum(timer.batch_times) / len(timer.batch_times), 3) if timer.batch_times else None,
+        'round_trips': sum(1 for command in archive.commands if 'command' in command),
+    }
+
+
+def save_results(results, output=None):
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'results': results,
+        }, f, indent=2)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('mode', choices=['parse', 'scrape', 'replay', 'startup'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(FIXTURE_SIZES))
+    parser.add_argument('--parsers', nargs='+', default=list(REVIEW_PARSERS),
+                        choices=list(REVIEW_PARSERS))
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds the stand-in server waits per review page')
+    parser.add_argument('--backend', choices=['selenium', 'http'], default='selenium',
+                        help='Scraper backend in scrape mode')
+    parser.add_argument('--capture', action='store_true',
+                        help='Decode reviews from network responses instead of the DOM')
+    parser.add_argument('--prune-dom', action='store_true',
+                        help='Empty review blocks in the page once read')
+    parser.add_argument('--pipeline', type=int, default=0,
+                        help='Batches fetched ahead while earlier ones are parsed')
+    parser.add_argument('--debug', action='store_true',
+                        help='Run Chrome in visible mode')
+    parser.add_argument('--launches', type=int, default=5,
+                        help='Browsers launched per profile in startup mode')
+    parser.add_argument('--archives', nargs='+', default=[],
+                        help='Session archives to replay')
+    parser.add_argument('--output', help='JSON file to write, defaults to benchmarks/results/')
+    args = parser.parse_args()
+
+    results = []
+    for path in args.archives if args.mode == 'replay' else []:
+        for parser_name in args.parsers:
+            result = bench_replay(path, parser_name)
+            print(json.dumps(result))
+            results.append(result)
+
+    if args.mode == 'startup':
+        for profile_template in (False, True):
+            result = bench_startup(args.launches, profile_template, args.debug)
+            print(json.dumps(result))
+            results.append(result)
+
+    for n_reviews in args.sizes if args.mode == 'scrape' and args.backend == 'http' else []:
+        result = bench_scrape_http(n_reviews, args.latency, args.pipeline)
+        print(json.dumps(result))
+        results.append(result)
+
+    for n_reviews in args.sizes if args.mode == 'parse' or (
+            args.mode == 'scrape' and args.backend == 'selenium') else []:
+        for parser_name in args.parsers:
+            if args.mode == 'parse':
+                result = bench_parse(n_reviews, parser_name)
+            else:
+                result = bench_scrape(n_reviews, parser_name, args.latency,
+                                      args.debug, args.capture, args.prune_dom,
+                                      args.pipeline)
+            print(json.dumps({key: value for key, value in result.items()
+                              if key != 'round_trips_by_command'}))
+            results.append(result)
+
+    print(f'Results saved to {save_results(results, args.output)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# server.py
+"""Local stand-in for the Google Maps review pane.
+
+Serves a place page with a cookie banner, a sort menu and a scrollable
+review list. Rejecting cookies stores a SOCS cookie, and the banner is left
+out of the pages of browsers that send it, like on Google Maps. Every
+scroll to the bottom of the list fetches the next page of review blocks
+from /reviews, after an optional artificial latency, the same way the live
+pane loads 10 reviews at a time. Each page is also requested as a
+listugcposts-style JSON payload, for the network capture mode.
+
+    python -m benchmarks.server --port 8765 --reviews 2000
+"""
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from .fixtures import make_review_blocks, make_review_payload
+
+PAGE_SIZE = 10
+FEATURE_ID = '0x14a1bd4e0f2ffc59:0x93665a87f83b5413'
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Stand-in place</title>
+<style>
+  .m6QErb {{ height: 700px; overflow-y: scroll; }}
+  .jftiEf {{ min-height: 140px; border-bottom: 1px solid #ddd; }}
+  #sort-menu {{ display: none; }}
+</style></head>
+<body>
+{consent}
+<button data-value="Sort" onclick="document.getElementById('sort-menu').style.display = 'block'">Sort</button>
+<div id="sort-menu">
+  <div role="menuitemradio" data-index="0">Most relevant</div>
+  <div role="menuitemradio" data-index="1">Newest</div>
+  <div role="menuitemradio" data-index="2">Highest rating</div>
+  <div role="menuitemradio" data-index="3">Lowest rating</div>
+</div>
+<div class="m6QErb DxyBCb kA9KIf dS8AEf">
+  <div id="reviews"></div>
+  <div class="lXJj5c">Loading</div>
+</div>
+<script>
+  window.APP_INITIALIZATION_STATE = [["{feature_id}"]];
+  var total = {total};
+  var offset = 0;
+  var loading = false;
+  var pane = document.querySelector('.m6QErb');
+  var list = document.getElementById('reviews');
+
+  function loadPage(replace) {{
+    loading = true;
+    fetch('/maps/rpc/listugcposts?offset=' + offset + '&n=' + total);
+    return fetch('/reviews?offset=' + offset + '&n=' + total)
+      .then(function (response) {{ return response.text(); }})
+      .then(function (html) {{
+        if (replace) {{ list.innerHTML = ''; }}
+        list.insertAdjacentHTML('beforeend', html);
+        offset = Math.min(offset + {page_size}, total);
+        loading = false;
+        if (offset >= total) {{
+          var placeholder = document.querySelector('.lXJj5c');
+          if (placeholder) {{ placeholder.remove(); }}
+        }}
+      }});
+  }}
+
+  document.querySelectorAll('[role=menuitemradio]').forEach(function (item) {{
+    item.addEventListener('click', function () {{
+      document.getElementById('sort-menu').style.display = 'none';
+      offset = 0;
+      loadPage(true);
+    }});
+  }});
+
+  pane.addEventListener('scroll', function () {{
+    if (loading || offset >= total) {{ return; }}
+    if (pane.scrollTop + pane.clientHeight >= pane.scrollHeight - 50) {{ loadPage(false); }}
+  }});
+
+  loadPage(false);
+</script>
+</body></html>
+'''
+
+CONSENT_BANNER = (
+    '<div id="consent"><button onclick="document.cookie = \'SOCS=stand-in; path=/; '
+    'max-age=31536000\'; this.parentNode.remove()"><span>Reject all</span></button></div>')
+
+
+class ReviewPaneHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    n_reviews = 100
+    latency = 0.0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == '/reviews':
+            time.sleep(self.latency)
+            n_reviews = int(query.get('n', [self.n_reviews])[0])
+            offset = int(query.get('offset', [0])[0])
+            count = max(0, min(PAGE_SIZE, n_reviews - offset))
+            self._send('\n'.join(make_review_blocks(offset, count)))
+        elif url.path == '/maps/rpc/listugcposts':
+            time.sleep(self.latency)
+            n_reviews = int(query.get('n', [self.n_reviews])[0])
+            offset = int(query.get('offset', [0])[0])
+            if 'pb' in query:
+                # Browserless clients page with the token of the previous page
+                token = re.search(r'!2s([^!]*)', query['pb'][0]).group(1)
+                offset = int(token.split('-')[1]) if token else 0
+            count = max(0, min(PAGE_SIZE, n_reviews - offset))
+            self._send(make_review_payload(offset, count, n_reviews),
+                       'application/json; charset=utf-8')
+        elif url.path.startswith('/maps'):
+            n_reviews = int(query.get('n', [self.n_reviews])[0])
+            consent = '' if 'SOCS=' in self.headers.get('Cookie', '') else CONSENT_BANNER
+            self._send(PAGE_TEMPLATE.format(
+                total=n_reviews, page_size=PAGE_SIZE, feature_id=FEATURE_ID, consent=consent))
+        else:
+            self.send_error(404)
+
+    def _send(self, body, content_type='text/html; charset=utf-8'):
+        payload = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(port=0, n_reviews=100, latency=0.0):
+    """
+    Build the stand-in server.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free one
+        n_reviews (int): Default number of reviews per place
+        latency (float): Seconds to wait before answering each /reviews page
+
+    Returns:
+        ThreadingHTTPServer: The server, not yet serving
+    """
+    handler = type('Handler', (ReviewPaneHandler,), {
+        'n_reviews': n_reviews, 'latency': latency})
+    return ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+
+def start_server(port=0, n_reviews=100, latency=0.0):
+    """Serve in a background thread, returns (server, base_url)."""
+    server = make_server(port, n_reviews, latency)
+    threading.Thread(target=server.serve_forever, daemon=True,
+                     name='review-pane-server').start()
+    host, port = server.server_address
+    return server, f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--reviews', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.reviews, args.latency)
+    print(f'Serving {args.reviews} reviews on http://127.0.0.1:{args.port}/maps/place/')
+    server.serve_forever()
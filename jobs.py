@@ -0,0 +1,248 @@
+# jobs.py
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, List, Optional
+from reviews_fetcher import ReviewsFetcher, Review, SortBy, place_url
+from review_cache import ReviewCache
+from request_coalescer import RequestCoalescer
+from review_store import ReviewStore
+from scraper_pool import ScraperPool
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    place_ids: List[str]
+    sort_by: SortBy
+    max_reviews: int
+    # Skip places whose review count has not changed since their last scrape
+    only_changed: bool = False
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    results: Dict[str, List[Review]] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    # Places of an only_changed job that were not scraped again
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def completed(self) -> int:
+        return len(self.results) + len(self.errors)
+
+    @property
+    def status(self) -> JobStatus:
+        if self.completed == len(self.place_ids):
+            return JobStatus.DONE
+        if self.started_at is not None:
+            return JobStatus.RUNNING
+        return JobStatus.QUEUED
+
+
+class JobManager:
+    def __init__(self,
+                 n_workers: int = 2,
+                 max_pending_places: int = 5000,
+                 result_ttl: float = 3600,
+                 pool: Optional[ScraperPool] = None,
+                 cache: Optional[ReviewCache] = None,
+                 store: Optional[ReviewStore] = None,
+                 coalescer: Optional[RequestCoalescer] = None,
+                 pipeline_depth: int = 0,
+                 scraper_options: Optional[Dict] = None,
+                 backend: str = 'selenium'):
+        """Runs scrape jobs on a bounded pool of background workers.
+
+        Args:
+            n_workers (int): Number of places scraped concurrently
+            max_pending_places (int): Places that may wait in the queue before
+                new jobs are rejected
+            result_ttl (float): Seconds a finished job is kept for polling
+            pool (ScraperPool): Scraper pool shared with the request handlers
+            cache (ReviewCache): Review cache shared with the request handlers
+            store (ReviewStore): If given, scraped reviews are upserted into it
+            coalescer (RequestCoalescer): If given, a place already being
+                scraped for a request or another job is not scraped again
+            pipeline_depth (int): Batches fetched ahead, see ReviewsFetcher
+            scraper_options (Dict): Extra scraper arguments when there is no pool
+            backend (str): Scraper backend when there is no pool
+        """
+        self.max_pending_places = max_pending_places
+        self.result_ttl = result_ttl
+        self.pool = pool
+        self.cache = cache
+        self.store = store
+        self.coalescer = coalescer
+        self.pipeline_depth = pipeline_depth
+        self.scraper_options = scraper_options
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(
+            max_workers=n_workers, thread_name_prefix='scrape-job')
+        self._jobs: Dict[str, Job] = {}
+        self._n_pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, place_ids: List[str], sort_by: SortBy = SortBy.NEWEST,
+               max_reviews: int = 100, only_changed: bool = False) -> Job:
+        """
+        Queue a job that scrapes every place in place_ids, once each.
+
+        With only_changed and a store, each place is probed first. A place
+        whose review count is unchanged since its last scrape is served from
+        the store, and only the new reviews of a grown place are scraped.
+        The store cannot reproduce Google's other orders, so only_changed
+        needs NEWEST.
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFullError: If the queue cannot take this many more places
+            ValueError: If only_changed is set with another sort order
+        """
+        if only_changed and sort_by != SortBy.NEWEST:
+            raise ValueError("only_changed needs sort_by NEWEST")
+        # Results are keyed by place id, a duplicate would never complete
+        job = Job(id=uuid.uuid4().hex, place_ids=list(dict.fromkeys(place_ids)),
+                  sort_by=sort_by, max_reviews=max_reviews,
+                  only_changed=only_changed)
+
+        with self._lock:
+            self._evict_finished()
+            if self._n_pending + len(job.place_ids) > self.max_pending_places:
+                raise QueueFullError(
+                    f"Job queue is full ({self._n_pending} places pending)")
+            self._n_pending += len(job.place_ids)
+            self._jobs[job.id] = job
+
+        for place_id in job.place_ids:
+            self._executor.submit(self._run_place, job, place_id)
+
+        logger.info(f"Queued job {job.id} with {len(job.place_ids)} places")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run_place(self, job: Job, place_id: str):
+        with self._lock:
+            if job.started_at is None:
+                job.started_at = time.time()
+
+        try:
+            url = place_url(place_id)
+            if job.only_changed and self.store:
+                reviews = self._scrape_if_changed(job, place_id, url)
+            elif self.coalescer:
+                reviews = self.coalescer.do(
+                    (url, job.sort_by.name), job.max_reviews,
+                    lambda: self._scrape(url, job.sort_by, job.max_reviews))
+            else:
+                reviews = self._scrape(url, job.sort_by, job.max_reviews)
+            with self._lock:
+                job.results[place_id] = reviews
+        except Exception as e:
+            logger.error(
+                f"Job {job.id} failed for place_id {place_id}: {str(e)}")
+            with self._lock:
+                job.errors[place_id] = str(e)
+        finally:
+            with self._lock:
+                self._n_pending -= 1
+                if job.status == JobStatus.DONE:
+                    job.finished_at = time.time()
+                    logger.info(
+                        f"Job {job.id} finished: {len(job.results)} places scraped, "
+                        f"{len(job.errors)} failed")
+
+    def _scrape(self, url: str, sort_by: SortBy, max_reviews: int) -> List[Review]:
+        with ReviewsFetcher(debug=False, pool=self.pool, cache=self.cache,
+                            scraper_options=self.scraper_options,
+                            backend=self.backend,
+                            pipeline_depth=self.pipeline_depth) as scraper:
+            reviews = scraper.get_reviews(
+                url=url,
+                sort_by=sort_by,
+                max_reviews=max_reviews
+            )
+        if self.store:
+            self._store_reviews(url, reviews)
+        return reviews
+
+    def _scrape_if_changed(self, job: Job, place_id: str, url: str) -> List[Review]:
+        last_metadata = self.store.get_place_summary(url)
+        if last_metadata is not None and not last_metadata['complete'] \
+                and (last_metadata['max_reviews'] or 0) < job.max_reviews:
+            # The last scrape stored fewer reviews than this job asks for
+            last_metadata = None
+
+        # Without the cache, a fresh cached entry would stand in for the delta
+        with ReviewsFetcher(debug=False, pool=self.pool,
+                            scraper_options=self.scraper_options,
+                            backend=self.backend,
+                            pipeline_depth=self.pipeline_depth) as scraper:
+            metadata, reviews = scraper.get_reviews_if_changed(
+                url, last_metadata, job.sort_by, job.max_reviews)
+            scrape_complete, exhausted = scraper.scrape_complete, scraper.exhausted
+
+        if reviews is None:
+            with self._lock:
+                job.unchanged.append(place_id)
+            self.store.put_place_summary(url, metadata, last_metadata['max_reviews'],
+                                         last_metadata['complete'])
+            reviews, _ = self.store.query(place=url, order='newest', limit=job.max_reviews)
+            return reviews
+
+        self.store.upsert(url, reviews)
+        grew = (last_metadata is not None and metadata['n_reviews'] is not None
+                and last_metadata['n_reviews'] is not None
+                and metadata['n_reviews'] > last_metadata['n_reviews'])
+        # The summary is only saved once the scrape got all it went for.
+        # Otherwise the old one stays and the next job scrapes again.
+        if scrape_complete and grew:
+            # Only the new reviews were scraped, the stored ones still count
+            self.store.put_place_summary(url, metadata, last_metadata['max_reviews'],
+                                         last_metadata['complete'])
+        elif scrape_complete:
+            self.store.put_place_summary(url, metadata, job.max_reviews, exhausted)
+        else:
+            logger.warning(f"Scrape of {url} did not complete, its place summary is kept")
+
+        if grew:
+            new_ids = {review.id_review for review in reviews}
+            stored, _ = self.store.query(place=url, order='newest', limit=job.max_reviews)
+            reviews = reviews + [review for review in stored if review.id_review not in new_ids]
+        return reviews[:job.max_reviews]
+
+    def _store_reviews(self, url: str, reviews: List[Review]):
+        # The job already has the reviews, a store failure is only logged
+        try:
+            self.store.upsert(url, reviews)
+        except Exception as e:
+            logger.error(f"Error storing reviews of {url}: {str(e)}")
+
+    def _evict_finished(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,87 @@
+# request_coalescer.py
+import logging
+import threading
+from typing import Callable, Dict, Hashable, List
+from scrapers.metrics import Counter
+logger = logging.getLogger(__name__)
+
+SCRAPES_TOTAL = Counter(
+    'gm_coalescer_scrapes_total', 'Scrapes started by the request coalescer.')
+# match is 'identical' for the same max_reviews, 'larger' for a scrape of more
+COALESCED_REQUESTS_TOTAL = Counter(
+    'gm_coalesced_requests_total',
+    'Requests served by a scrape already in flight instead of their own.', ['match'])
+
+
+class _Call:
+    def __init__(self, max_reviews: int):
+        self.max_reviews = max_reviews
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.n_waiters = 0
+
+
+class RequestCoalescer:
+    def __init__(self):
+        """Singleflight for scrapes: concurrent requests for the same key wait
+        on one scrape in flight instead of each starting a browser.
+
+        A request joins a scrape of at least as many reviews and gets the
+        first max_reviews of its result. Only in-flight scrapes are shared,
+        finished results are the ReviewCache's job.
+        """
+        self._calls: Dict[Hashable, List[_Call]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, max_reviews: int, fn: Callable[[], List]) -> List:
+        """
+        Run fn, or wait for the scrape in flight that already covers the request.
+
+        Args:
+            key (Hashable): What is scraped, e.g. (url, sort order)
+            max_reviews (int): Reviews the request asks for
+            fn (Callable): Scrapes max_reviews reviews
+
+        Returns:
+            List: At most max_reviews reviews
+
+        Raises:
+            Exception: What fn raised, also in the requests that joined it
+        """
+        with self._lock:
+            calls = self._calls.setdefault(key, [])
+            # Of the scrapes that cover the request, join the one that
+            # finishes first
+            joined = min((call for call in calls if call.max_reviews >= max_reviews),
+                         key=lambda call: call.max_reviews, default=None)
+            if joined is None:
+                call = _Call(max_reviews)
+                calls.append(call)
+            else:
+                joined.n_waiters += 1
+
+        if joined is not None:
+            COALESCED_REQUESTS_TOTAL.inc(
+                match='identical' if joined.max_reviews == max_reviews else 'larger')
+            logger.info(f"Joining the scrape of {joined.max_reviews} reviews in flight for {key}")
+            joined.done.wait()
+            if joined.error is not None:
+                raise joined.error
+            return joined.result[:max_reviews]
+
+        SCRAPES_TOTAL.inc()
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                calls.remove(call)
+                if not calls:
+                    del self._calls[key]
+            call.done.set()
+            if call.n_waiters:
+                logger.info(f"Scrape for {key} served {call.n_waiters} more requests")
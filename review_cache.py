@@ -0,0 +1,107 @@
+# review_cache.py
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Hashable, List, Optional
+
+
+@dataclass
+class CacheEntry:
+    reviews: List
+    complete: bool = False
+    fetched_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def covers(self, max_reviews: int) -> bool:
+        """Whether this entry can answer a request for max_reviews reviews."""
+        return self.complete or len(self.reviews) >= max_reviews
+
+
+class ReviewCache:
+    def __init__(self,
+                 ttl: float = 900,
+                 max_stale: float = 86400,
+                 max_entries: int = 256,
+                 max_reviews_per_entry: int = 1000):
+        """TTL and size-bounded LRU cache of scraped reviews.
+
+        Args:
+            ttl (float): Seconds an entry is served as-is
+            max_stale (float): Seconds a stale entry is kept as the base for a
+                delta refresh before it is dropped
+            max_entries (int): Maximum number of cached places, least recently
+                used entries are evicted first
+            max_reviews_per_entry (int): Maximum number of reviews kept per entry
+        """
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.max_reviews_per_entry = max_reviews_per_entry
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, allow_stale: bool = False) -> Optional[CacheEntry]:
+        """
+        Look up an entry.
+
+        Args:
+            key (Hashable): Cache key, e.g. (url, sort order)
+            allow_stale (bool): If True, entries older than ttl are returned too
+
+        Returns:
+            Optional[CacheEntry]: The entry, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.age >= self.max_stale:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        if entry.age >= self.ttl and not allow_stale:
+            return None
+        return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return entry.age < self.ttl
+
+    def put(self, key: Hashable, reviews: List, complete: bool = False) -> CacheEntry:
+        entry = CacheEntry(
+            reviews=reviews[:self.max_reviews_per_entry],
+            complete=complete and len(reviews) <= self.max_reviews_per_entry)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def merge_newest(self, key: Hashable, new_reviews: List, base: CacheEntry) -> CacheEntry:
+        """
+        Put new_reviews on top of the reviews of a previous entry.
+
+        Args:
+            key (Hashable): Cache key
+            new_reviews (List): Reviews newer than everything in base, newest first
+            base (CacheEntry): Entry the delta refresh started from
+
+        Returns:
+            CacheEntry: The merged entry
+        """
+        new_ids = {review.id_review for review in new_reviews}
+        merged = list(new_reviews) + [
+            review for review in base.reviews if review.id_review not in new_ids]
+        return self.put(key, merged, complete=base.complete)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,107 @@
+# review_pipeline.py
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+
+class ReviewPipeline:
+    def __init__(self, scraper, depth: int = 2, parse_workers: int = 2):
+        """Fetches review batches ahead of the reader and parses them in a
+        thread pool, so the browser loads the next batch while Python parses
+        the previous ones.
+
+        A producer thread calls scraper.fetch_raw_batch for consecutive
+        offsets and hands each batch to the parser pool. At most depth
+        batches wait to be read, then the producer blocks.
+
+        Args:
+            scraper: Scraper backend, only the producer thread drives it
+            depth (int): Batches fetched ahead of the reader
+            parse_workers (int): Threads running scraper.parse_raw_batch
+        """
+        self.scraper = scraper
+        self.depth = depth
+        self._parsers = ThreadPoolExecutor(
+            max_workers=parse_workers, thread_name_prefix='review-parser')
+        self._queue = None
+        self._producer = None
+        self._stop = threading.Event()
+        # Offset of the next batch the producer hands over
+        self._next_offset = None
+
+    def get(self, offset: int) -> List[Dict]:
+        """
+        The review dicts from offset onwards, like scraper.get_reviews(offset).
+        Reading the batches in order keeps the producer going, reading any
+        other offset restarts it there.
+
+        Raises:
+            Exception: What fetching or parsing the batch raised
+        """
+        if self._producer is None or offset != self._next_offset:
+            self.stop()
+            self._start(offset)
+
+        item = self._queue.get()
+        if isinstance(item, Exception):
+            self._producer.join()
+            self._producer = None
+            raise item
+
+        batch_offset, n_raw, future = item
+        if n_raw == 0:
+            # The producer reached the end of the review list and returned
+            self._producer.join()
+            self._producer = None
+        batch = future.result()
+        self._next_offset = batch_offset + len(batch)
+        return batch
+
+    def stop(self):
+        """Stop the producer, once it returns the scraper may be used again."""
+        if self._producer is None:
+            return
+        self._stop.set()
+        # Unblock a producer waiting for room in the queue
+        while self._producer.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._producer.join()
+        self._producer = None
+
+    def close(self):
+        self.stop()
+        self._parsers.shutdown(wait=True)
+
+    def _start(self, offset: int):
+        self._stop.clear()
+        self._queue = queue.Queue(maxsize=self.depth)
+        self._next_offset = offset
+        self._producer = threading.Thread(
+            target=self._produce, args=(offset,), daemon=True, name='review-producer')
+        self._producer.start()
+
+    def _produce(self, offset: int):
+        while not self._stop.is_set():
+            try:
+                raw_batch = self.scraper.fetch_raw_batch(offset)
+            except Exception as e:
+                self._put(e)
+                return
+            self._put((offset, len(raw_batch.data),
+                       self._parsers.submit(self.scraper.parse_raw_batch, raw_batch)))
+            if not raw_batch.data:
+                # End of the review list
+                return
+            offset += len(raw_batch.data)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
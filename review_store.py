@@ -0,0 +1,280 @@
+# review_store.py
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from reviews_fetcher import Review
+
+# Sort orders accepted by ReviewStore.query
+ORDER_BY = {
+    'newest': 'submitted_at DESC, id_review',
+    'oldest': 'submitted_at ASC, id_review',
+    'highest_rating': 'rating DESC, submitted_at DESC, id_review',
+    'lowest_rating': 'rating ASC, submitted_at DESC, id_review',
+}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS reviews (
+    id_review TEXT PRIMARY KEY,
+    place TEXT NOT NULL,
+    content TEXT,
+    submitted_at TEXT,
+    submitted_at_earliest TEXT,
+    submitted_at_latest TEXT,
+    rating REAL,
+    username TEXT,
+    -- As scraped, a str or the int 0: BLOB affinity keeps either type as is
+    n_review_user BLOB,
+    avatar TEXT,
+    reply_content TEXT,
+    reply_date TEXT,
+    reply_date_earliest TEXT,
+    reply_date_latest TEXT,
+    url_user TEXT,
+    first_seen_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reviews_place_submitted_at ON reviews (place, submitted_at);
+CREATE INDEX IF NOT EXISTS idx_reviews_place_rating ON reviews (place, rating);
+CREATE INDEX IF NOT EXISTS idx_reviews_submitted_at ON reviews (submitted_at);
+CREATE TABLE IF NOT EXISTS places (
+    place TEXT PRIMARY KEY,
+    name TEXT,
+    rating REAL,
+    n_reviews INTEGER,
+    probed_at TEXT NOT NULL,
+    max_reviews INTEGER,
+    complete INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+_PLACE_COLUMNS = ['name', 'rating', 'n_reviews', 'probed_at', 'max_reviews', 'complete']
+
+_COLUMNS = ['id_review', 'place', 'content', 'submitted_at', 'submitted_at_earliest',
+            'submitted_at_latest', 'rating', 'username', 'n_review_user', 'avatar',
+            'reply_content', 'reply_date', 'reply_date_earliest', 'reply_date_latest',
+            'url_user']
+
+# Relative dates are re-estimated against each scrape's anchor, so a later
+# scrape must not replace an older estimate: the windows of both are
+# intersected and the first estimate is kept, clamped into the intersection.
+# Windows that do not overlap (or are missing) keep the stored values.
+_DATE_UPDATES = '''
+    {date} = CASE WHEN {overlap}
+        THEN MIN(MAX(COALESCE(reviews.{date}, excluded.{date}), {earliest_max}), {latest_min})
+        ELSE COALESCE(reviews.{date}, excluded.{date}) END,
+    {date}_earliest = CASE WHEN {overlap} THEN {earliest_max}
+        ELSE COALESCE(reviews.{date}_earliest, excluded.{date}_earliest) END,
+    {date}_latest = CASE WHEN {overlap} THEN {latest_min}
+        ELSE COALESCE(reviews.{date}_latest, excluded.{date}_latest) END'''
+
+
+def _date_updates(date):
+    return _DATE_UPDATES.format(
+        date=date,
+        overlap=(f'excluded.{date}_earliest <= reviews.{date}_latest '
+                 f'AND excluded.{date}_latest >= reviews.{date}_earliest'),
+        earliest_max=f'MAX(reviews.{date}_earliest, excluded.{date}_earliest)',
+        latest_min=f'MIN(reviews.{date}_latest, excluded.{date}_latest)')
+
+
+_DATE_COLUMNS = {'submitted_at', 'submitted_at_earliest', 'submitted_at_latest',
+                 'reply_date', 'reply_date_earliest', 'reply_date_latest'}
+
+# Everything but the key, first_seen_at and the dates is refreshed by a
+# later scrape
+_UPSERT = '''
+INSERT INTO reviews ({columns}, first_seen_at, updated_at)
+VALUES ({placeholders}, :now, :now)
+ON CONFLICT(id_review) DO UPDATE SET {updates}, {date_updates},
+    updated_at = excluded.updated_at
+'''.format(
+    columns=', '.join(_COLUMNS),
+    placeholders=', '.join(f':{column}' for column in _COLUMNS),
+    updates=', '.join(f'{column} = excluded.{column}' for column in _COLUMNS[1:]
+                      if column not in _DATE_COLUMNS),
+    date_updates=', '.join(_date_updates(date) for date in ('submitted_at', 'reply_date')))
+
+
+def _to_text(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _to_local_text(value):
+    """Stored dates are naive local times, compare aware ones as such."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return _to_text(value)
+
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _window(earliest, latest):
+    return (_to_datetime(earliest), _to_datetime(latest)) if earliest else None
+
+
+class ReviewStore:
+    def __init__(self, path: str = 'reviews.db'):
+        """SQLite store of scraped reviews, upserted by id_review.
+
+        One connection is shared by the threads of a process. Several
+        processes (gunicorn workers) may open the same file, writes are
+        serialized by SQLite.
+
+        Args:
+            path (str): Database file, ':memory:' for a throwaway store
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ':memory:':
+                # Readers do not block the writer of another worker
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+
+    def upsert(self, place: str, reviews: Iterable[Review]) -> int:
+        """
+        Insert new reviews and refresh known ones.
+
+        Args:
+            place (str): Place the reviews belong to, its Google Maps URL
+            reviews (Iterable[Review]): Reviews, those without an id are skipped
+
+        Returns:
+            int: Number of reviews written
+        """
+        now = datetime.now().isoformat()
+        rows = []
+        for review in reviews:
+            if not review.id_review:
+                continue
+            submitted_window = review.submitted_at_window or (None, None)
+            reply_window = review.reply_date_window or (None, None)
+            row = {column: _to_text(getattr(review, column, None)) for column in _COLUMNS}
+            row.update({
+                'place': place,
+                'submitted_at_earliest': _to_text(submitted_window[0]),
+                'submitted_at_latest': _to_text(submitted_window[1]),
+                'reply_date_earliest': _to_text(reply_window[0]),
+                'reply_date_latest': _to_text(reply_window[1]),
+                'now': now,
+            })
+            rows.append(row)
+
+        if rows:
+            with self._lock, self._conn:
+                self._conn.executemany(_UPSERT, rows)
+        return len(rows)
+
+    def query(self,
+              place: Optional[str] = None,
+              min_rating: Optional[float] = None,
+              max_rating: Optional[float] = None,
+              since: Optional[datetime] = None,
+              until: Optional[datetime] = None,
+              order: str = 'newest',
+              limit: int = 100,
+              offset: int = 0) -> Tuple[List[Review], int]:
+        """
+        Read stored reviews.
+
+        Args:
+            place (str): Only reviews of this place
+            min_rating (float): Only reviews rated at least this
+            max_rating (float): Only reviews rated at most this
+            since (datetime): Only reviews submitted at or after this,
+                naive datetimes are local time like the stored dates
+            until (datetime): Only reviews submitted before this
+            order (str): One of ORDER_BY
+            limit (int): Page size
+            offset (int): Reviews to skip
+
+        Returns:
+            Tuple[List[Review], int]: The page of reviews and the number of
+                reviews matching the filters
+        """
+        conditions = []
+        params = []
+        for condition, value in [('place = ?', place),
+                                 ('rating >= ?', min_rating),
+                                 ('rating <= ?', max_rating),
+                                 ('submitted_at >= ?', _to_local_text(since)),
+                                 ('submitted_at < ?', _to_local_text(until))]:
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with self._lock:
+            total = self._conn.execute(
+                f'SELECT COUNT(*) FROM reviews {where}', params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM reviews {where} "
+                f"ORDER BY {ORDER_BY[order]} LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return [self._to_review(dict(zip(_COLUMNS, row))) for row in rows], total
+
+    def get_place_summary(self, place: str) -> Optional[Dict]:
+        """
+        The place summary saved with the last complete scrape of the place.
+
+        Returns:
+            Optional[Dict]: name, rating, n_reviews, probed_at, and how many
+                of the newest reviews the store holds: max_reviews of the
+                scrape, or all of them if complete. None if never saved.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_PLACE_COLUMNS)} FROM places WHERE place = ?",
+                (place,)).fetchone()
+        if row is None:
+            return None
+        summary = dict(zip(_PLACE_COLUMNS, row))
+        summary.update(probed_at=_to_datetime(summary['probed_at']),
+                       complete=bool(summary['complete']))
+        return summary
+
+    def put_place_summary(self, place: str, summary: Dict,
+                          max_reviews: Optional[int] = None, complete: bool = False):
+        """
+        Save a place summary (name, rating, n_reviews) as of now.
+
+        Args:
+            place (str): The place's Google Maps URL
+            summary (Dict): Place header, see ReviewsFetcher.get_place_metadata
+            max_reviews (int): Newest reviews the scrape stored
+            complete (bool): Whether the scrape reached the end of the list
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO places (place, {', '.join(_PLACE_COLUMNS)}) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (place, summary.get('name'), summary.get('rating'), summary.get('n_reviews'),
+                 datetime.now().isoformat(), max_reviews, int(complete)))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_review(row: dict) -> Review:
+        return Review(
+            id_review=row['id_review'],
+            content=row['content'],
+            submitted_at=_to_datetime(row['submitted_at']),
+            rating=row['rating'],
+            username=row['username'],
+            n_review_user=row['n_review_user'],
+            avatar=row['avatar'],
+            reply_content=row['reply_content'],
+            reply_date=_to_datetime(row['reply_date']),
+            url_user=row['url_user'],
+            source_url=row['place'],
+            submitted_at_window=_window(
+                row['submitted_at_earliest'], row['submitted_at_latest']),
+            reply_date_window=_window(
+                row['reply_date_earliest'], row['reply_date_latest']),
+        )
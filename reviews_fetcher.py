@@ -1,13 +1,40 @@
 # google_maps_scraper.py
 from dataclasses import dataclass
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterable, Iterator, Optional, Set, Tuple, Union
 from enum import Enum
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
+import multiprocessing
 import logging
+import os
+from selenium.common.exceptions import WebDriverException
 from scrapers.google_maps_reviews_scraper import GoogleMapsReviewsScraper
+from scrapers.google_maps_http_scraper import GoogleMapsHttpScraper
+from scrapers.tab_scheduler import TabScheduler
+from scrapers.metrics import (BATCHES_TOTAL, DRIVER_RESTARTS_TOTAL, PHASE_SECONDS,
+                              PLACES_UNCHANGED_TOTAL, RETRIES_TOTAL, REVIEWS_TOTAL)
+from scraper_pool import ScraperPool
+from review_cache import ReviewCache
+from review_pipeline import ReviewPipeline
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def place_url(place_id: str) -> str:
+    """Google Maps URL of a place, given its place_id."""
+    return f"https://www.google.com/maps/place/?q=place_id:{place_id}"
+
+
+# Scraper backends by name. A backend is a class taking debug plus its own
+# keyword options, with sort_by(url, ind), get_reviews(offset) and cleanup().
+# Pipelined fetchers also use fetch_raw_batch(offset) and parse_raw_batch(),
+# which split get_reviews into its browser and its parsing half.
+BACKENDS = {
+    'selenium': GoogleMapsReviewsScraper,
+    'http': GoogleMapsHttpScraper,
+}
+
+
 class SortBy(Enum):
     MOST_RELEVANT = 0
     NEWEST = 1
@@ -15,7 +42,7 @@ class SortBy(Enum):
     LOWEST_RATING = 3
 
 
-@dataclass
+@dataclass(slots=True)
 class Review:
     id_review: str
     content: str
@@ -28,27 +55,121 @@ class Review:
     reply_date: str
     url_user: str
     source_url: Optional[str] = None
+    # (earliest, latest) bounds of submitted_at and reply_date, which are
+    # estimated from relative dates like "a month ago"
+    submitted_at_window: Optional[Tuple] = None
+    reply_date_window: Optional[Tuple] = None
+
+
+# One fetcher, and so one browser, per get_reviews_many worker process
+_worker_fetcher = None
+
+
+def _fetch_place_in_worker(url: str, sort_by: 'SortBy', max_reviews: int, debug: bool,
+                           scraper_options: Optional[Dict]) -> List['Review']:
+    global _worker_fetcher
+    if _worker_fetcher is None:
+        _worker_fetcher = ReviewsFetcher(
+            debug=debug, scraper_options=scraper_options).__enter__()
+        # Worker processes skip atexit, so close the browser from
+        # multiprocessing's own exit hook
+        Finalize(_worker_fetcher, _worker_fetcher.__exit__,
+                 args=(None, None, None), exitpriority=10)
+    return _worker_fetcher.get_reviews(url, sort_by, max_reviews)
 
 
 class ReviewsFetcher:
-    def __init__(self, debug: bool = False):
+    def __init__(self,
+                 debug: bool = False,
+                 pool: Optional[ScraperPool] = None,
+                 cache: Optional[ReviewCache] = None,
+                 scraper_options: Optional[Dict] = None,
+                 backend: Union[str, type] = 'selenium',
+                 pipeline_depth: int = 0,
+                 parse_workers: int = 2):
         """Initialize the scraper.
 
         Args:
             debug (bool): If True, runs browser in visible mode
+            pool (ScraperPool): If given, scrapers are checked out of this pool
+                instead of launching a new browser
+            cache (ReviewCache): If given, get_reviews serves and refreshes
+                results through this cache
+            scraper_options (Dict): Extra scraper backend arguments,
+                e.g. {'block_resources': True}. Ignored when a pool is given.
+            backend (str | type): 'selenium' (Chrome), 'http' (browserless)
+                or a scraper class. Ignored when a pool is given.
+            pipeline_depth (int): If above 0, iter_reviews fetches up to this
+                many batches ahead while earlier ones are parsed, see
+                ReviewPipeline. 0 fetches and parses one batch at a time.
+            parse_workers (int): Parser threads of a pipelined fetcher
         """
         self.debug = debug
+        self.pool = pool
+        self.cache = cache
+        self.scraper_options = scraper_options or {}
+        self.backend = BACKENDS[backend] if isinstance(backend, str) else backend
+        self.pipeline_depth = pipeline_depth
+        self.parse_workers = parse_workers
         self.scraper = None
+        # Pipeline of the running iter_reviews, if pipelined
+        self._pipeline = None
+        # Set by iter_reviews when the end of the review list was reached
+        self.exhausted = False
+        # Set by iter_reviews when it stopped at one of stop_at_ids
+        self.reached_known_review = False
+        # Set by get_reviews_if_changed: whether its scrape got every review
+        # it went for, a failed scrape returns what it got without raising
+        self.scrape_complete = False
 
     def __enter__(self):
-        self.scraper = GoogleMapsReviewsScraper(debug=self.debug)
+        self.scraper = self._new_scraper()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self._close_pipeline()
         if self.scraper:
-            self.scraper.cleanup()
+            if self.pool:
+                # GeneratorExit from an abandoned iter_reviews leaves the
+                # browser healthy, so only real errors discard it
+                self.pool.release(
+                    self.scraper,
+                    discard=exc_type is not None and issubclass(exc_type, Exception))
+            else:
+                self.scraper.cleanup()
             self.scraper = None
 
+    def _new_scraper(self):
+        if self.pool:
+            return self.pool.acquire()
+        return self.backend(debug=self.debug, **self.scraper_options)
+
+    def _close_pipeline(self):
+        pipeline, self._pipeline = self._pipeline, None
+        if pipeline:
+            pipeline.close()
+
+    def _get_batch(self, start_index: int) -> List[Dict]:
+        if not self.pipeline_depth:
+            return self.scraper.get_reviews(start_index)
+        if self._pipeline is None:
+            self._pipeline = ReviewPipeline(
+                self.scraper, self.pipeline_depth, self.parse_workers)
+        return self._pipeline.get(start_index)
+
+    def _reset_scraper(self):
+        """Replace the current scraper with a fresh one."""
+        DRIVER_RESTARTS_TOTAL.inc()
+        # The pipeline's producer must let go of the old scraper first
+        self._close_pipeline()
+        scraper, self.scraper = self.scraper, None
+        if scraper:
+            if self.pool:
+                self.pool.release(scraper, discard=True)
+            else:
+                scraper.cleanup()
+        self.scraper = self._new_scraper()
+
     def get_reviews(self,
                     url: str,
                     sort_by: SortBy = SortBy.NEWEST,
@@ -64,20 +185,83 @@ class ReviewsFetcher:
         Returns:
             List[Review]: List of scraped reviews
         """
+        if self.cache is None:
+            return list(self.iter_reviews(url, sort_by, max_reviews))
+
+        key = (url, sort_by.name)
+        entry = self.cache.get(key, allow_stale=sort_by == SortBy.NEWEST)
+        if entry and entry.covers(max_reviews):
+            if self.cache.is_fresh(entry):
+                logger.info(f"Serving {url} from review cache")
+                return entry.reviews[:max_reviews]
+
+            if sort_by == SortBy.NEWEST and entry.reviews:
+                return self._refresh_newest(key, entry, url, max_reviews)
+
+        reviews = list(self.iter_reviews(url, sort_by, max_reviews))
+        self.cache.put(key, reviews, complete=self.exhausted)
+        return reviews
+
+    def _refresh_newest(self, key, entry, url: str, max_reviews: int) -> List[Review]:
+        """Scroll only until a cached review shows up and merge the new ones on top."""
+        known_ids = {review.id_review for review in entry.reviews}
+        new_reviews = list(self.iter_reviews(
+            url, SortBy.NEWEST, max_reviews, stop_at_ids=known_ids))
+        logger.info(
+            f"Delta refresh found {len(new_reviews)} new reviews for {url}")
+
+        if len(new_reviews) >= max_reviews:
+            # Never reached a cached review, so there may be a gap between the
+            # new reviews and the cached ones
+            self.cache.put(key, new_reviews)
+            return new_reviews
+
+        if not (self.reached_known_review or self.exhausted):
+            # The scrape failed before reaching a cached review. Merging would
+            # mark the entry fresh without knowing what is missing, so it stays
+            # stale and the next request refreshes it again.
+            logger.warning(f"Delta refresh of {url} failed, serving the stale cache entry")
+            return entry.reviews[:max_reviews]
+
+        return self.cache.merge_newest(key, new_reviews, entry).reviews[:max_reviews]
+
+    def iter_reviews(self,
+                     url: str,
+                     sort_by: SortBy = SortBy.NEWEST,
+                     max_reviews: int = 100,
+                     stop_at_ids: Optional[Set[str]] = None) -> Iterator[Review]:
+        """
+        Scrape reviews from a Google Maps URL, yielding each review as soon
+        as its batch is parsed.
+
+        Args:
+            url (str): Google Maps URL to scrape
+            sort_by (SortBy): How to sort the reviews
+            max_reviews (int): Maximum number of reviews to fetch
+            stop_at_ids (Set[str]): Stop as soon as a review with one of these
+                ids is reached, used for delta refreshes
+
+        Yields:
+            Review: Scraped reviews, in page order
+        """
         if not self.scraper:
             raise RuntimeError("Scraper must be used within a context manager")
 
-        reviews = []
+        self.exhausted = False
+        self.reached_known_review = False
+        # A pipeline left from an earlier scrape may still be scrolling
+        self._close_pipeline()
         seen_reviews = set()
         max_retries = 3
         retry_count = 0
 
         while retry_count < max_retries:
             try:
-                error = self.scraper.sort_by(url, sort_by.value)
+                with PHASE_SECONDS.time(phase='sort_by'):
+                    error = self.scraper.sort_by(url, sort_by.value)
                 if error != 0:
                     logger.error(f"Failed to sort reviews: {error}")
-                    return reviews
+                    return
                 break
             except Exception as e:
                 retry_count += 1
@@ -85,15 +269,15 @@ class ReviewsFetcher:
                     f"Error during sort_by (attempt {retry_count}/{max_retries}): {str(e)}")
                 if retry_count == max_retries:
                     logger.error("Max retries reached for sort_by operation")
-                    return reviews
+                    return
+                RETRIES_TOTAL.inc(operation='sort_by')
                 # Try to reinitialize the scraper
                 try:
-                    self.scraper.cleanup()
-                    self.scraper = GoogleMapsReviewsScraper(debug=self.debug)
+                    self._reset_scraper()
                 except Exception as cleanup_error:
                     logger.error(
                         f"Error during scraper reinitialization: {str(cleanup_error)}")
-                    return reviews
+                    return
 
         processed_reviews = 0
         start_index = 0
@@ -105,9 +289,12 @@ class ReviewsFetcher:
                 logger.info(
                     f"Fetching reviews starting at index {start_index}")
 
-                batch = self.scraper.get_reviews(start_index)
+                with PHASE_SECONDS.time(phase='batch'):
+                    batch = self._get_batch(start_index)
+                BATCHES_TOTAL.inc(result='ok')
                 if not batch:
                     logger.info("No more reviews available")
+                    self.exhausted = True
                     break
 
                 consecutive_failures = 0  # Reset on successful batch
@@ -115,36 +302,34 @@ class ReviewsFetcher:
                     if processed_reviews >= max_reviews:
                         break
 
-                    # Check if we've seen this review content + username combination before
-                    review_key = (review_dict['content'],
-                                  review_dict['username'])
+                    if stop_at_ids and review_dict['id_review'] in stop_at_ids:
+                        logger.info(
+                            "Reached an already known review, ending review collection")
+                        self.reached_known_review = True
+                        return
+
+                    # Check if we've seen this review before. Reviews without an
+                    # id fall back to a hash of their content + username.
+                    review_key = review_dict['id_review'] or hash(
+                        (review_dict['content'], review_dict['username']))
                     if review_key in seen_reviews:
                         logger.info(
                             "Duplicate review found, ending review collection")
-                        return reviews
-
-                    review = Review(
-                        id_review=review_dict['id_review'],
-                        content=review_dict['content'],
-                        submitted_at=review_dict['submitted_at'],
-                        rating=review_dict['rating'],
-                        username=review_dict['username'],
-                        n_review_user=review_dict['n_review_user'],
-                        avatar=review_dict['avatar'],
-                        reply_content=review_dict['reply_content'],
-                        reply_date=review_dict['reply_date'],
-                        url_user=review_dict['url_user'],
-                        source_url=url
-                    )
+                        self.exhausted = True
+                        return
+
+                    review = self._to_review(review_dict, url)
                     if (review.content is not None):
-                        seen_reviews.add((review.content, review.username))
-                        reviews.append(review)
+                        seen_reviews.add(review_key)
+                        REVIEWS_TOTAL.inc()
+                        yield review
                         processed_reviews += 1
 
                     start_index += 1
 
             except Exception as e:
                 consecutive_failures += 1
+                BATCHES_TOTAL.inc(result='failed')
                 logger.error(
                     f"Error fetching reviews (attempt {consecutive_failures}/{max_consecutive_failures}): {str(e)}")
 
@@ -152,11 +337,11 @@ class ReviewsFetcher:
                     logger.error(
                         "Max consecutive failures reached, stopping review collection")
                     break
+                RETRIES_TOTAL.inc(operation='batch')
 
                 # Try to reinitialize the scraper
                 try:
-                    self.scraper.cleanup()
-                    self.scraper = GoogleMapsReviewsScraper(debug=self.debug)
+                    self._reset_scraper()
                     # Retry the sort operation
                     error = self.scraper.sort_by(url, sort_by.value)
                     if error != 0:
@@ -168,17 +353,120 @@ class ReviewsFetcher:
                         f"Error during scraper reinitialization: {str(cleanup_error)}")
                     break
 
-        return reviews
+    @staticmethod
+    def _to_review(review_dict: Dict, url: str) -> Review:
+        return Review(
+            id_review=review_dict['id_review'],
+            content=review_dict['content'],
+            submitted_at=review_dict['submitted_at'],
+            rating=review_dict['rating'],
+            username=review_dict['username'],
+            n_review_user=review_dict['n_review_user'],
+            avatar=review_dict['avatar'],
+            reply_content=review_dict['reply_content'],
+            reply_date=review_dict['reply_date'],
+            url_user=review_dict['url_user'],
+            source_url=url,
+            submitted_at_window=review_dict['submitted_at_window'],
+            reply_date_window=review_dict['reply_date_window']
+        )
+
+    def get_reviews_tabs(self,
+                         urls: Iterable[str],
+                         sort_by: SortBy = SortBy.NEWEST,
+                         max_reviews: int = 100,
+                         max_tabs: int = 4,
+                         return_exceptions: bool = False) -> Iterator[Tuple[str, List[Review]]]:
+        """
+        Scrape many places as tabs of this fetcher's browser, see TabScheduler.
+        Needs the selenium backend without capture_network or record_to.
+
+        Args:
+            urls (Iterable[str]): Google Maps URLs to scrape
+            sort_by (SortBy): How to sort the reviews
+            max_reviews (int): Maximum number of reviews to fetch per place
+            max_tabs (int): Places scraped at the same time
+            return_exceptions (bool): If True, a failed place yields its
+                exception instead of an empty list
+
+        Yields:
+            Tuple[str, List[Review]]: (url, reviews) per place, in urls order
+        """
+        if not self.scraper:
+            raise RuntimeError("Scraper must be used within a context manager")
+
+        urls = list(urls)
+        results = TabScheduler(self.scraper, max_tabs).scrape(urls, sort_by.value, max_reviews)
+        for url in urls:
+            result = results[url]
+            if isinstance(result, Exception):
+                yield url, result if return_exceptions else []
+                continue
+            REVIEWS_TOTAL.inc(len(result))
+            yield url, [self._to_review(review_dict, url) for review_dict in result]
+
+    @classmethod
+    def get_reviews_many(cls,
+                         urls: Iterable[str],
+                         sort_by: SortBy = SortBy.NEWEST,
+                         max_reviews: int = 100,
+                         concurrency: Optional[int] = None,
+                         debug: bool = False,
+                         return_exceptions: bool = False,
+                         scraper_options: Optional[Dict] = None) -> Iterator[Tuple[str, List[Review]]]:
+        """
+        Scrape many places in parallel, one browser per worker process.
+
+        Args:
+            urls (Iterable[str]): Google Maps URLs to scrape
+            sort_by (SortBy): How to sort the reviews
+            max_reviews (int): Maximum number of reviews to fetch per place
+            concurrency (int): Number of worker processes, defaults to the CPU count
+            debug (bool): If True, runs browsers in visible mode
+            return_exceptions (bool): If True, a failed place yields its
+                exception instead of an empty list
+            scraper_options (Dict): Extra GoogleMapsReviewsScraper arguments
+
+        Yields:
+            Tuple[str, List[Review]]: (url, reviews) as each place finishes
+        """
+        urls = list(urls)
+        concurrency = min(concurrency or os.cpu_count() or 1, len(urls) or 1)
+
+        # spawn keeps worker processes clear of the parent's threads and browsers
+        executor = ProcessPoolExecutor(
+            max_workers=concurrency,
+            mp_context=multiprocessing.get_context('spawn'))
+        try:
+            futures = {
+                executor.submit(_fetch_place_in_worker, url, sort_by, max_reviews,
+                                debug, scraper_options): url
+                for url in urls
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    yield url, future.result()
+                except Exception as e:
+                    logger.error(f"Error fetching reviews for {url}: {str(e)}")
+                    yield url, e if return_exceptions else []
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
     def get_place_metadata(self, url: str) -> Dict:
         """
-        Get metadata about a place.
+        Get metadata about a place from its header, without scraping reviews.
+        Needs the selenium backend.
 
         Args:
             url (str): Google Maps URL
 
         Returns:
-            Dict: Place metadata
+            Dict: name, rating and n_reviews of the place
+
+        Raises:
+            RuntimeError: If the page has no place header, e.g. a bad place id.
+                Only browser errors are retried, in a fresh browser.
         """
         if not self.scraper:
             raise RuntimeError("Scraper must be used within a context manager")
@@ -189,7 +477,7 @@ class ReviewsFetcher:
         while retry_count < max_retries:
             try:
                 return self.scraper.get_account(url)
-            except Exception as e:
+            except WebDriverException as e:
                 retry_count += 1
                 logger.error(
                     f"Error getting place metadata (attempt {retry_count}/{max_retries}): {str(e)}")
@@ -200,9 +488,66 @@ class ReviewsFetcher:
 
                 # Try to reinitialize the scraper
                 try:
-                    self.scraper.cleanup()
-                    self.scraper = GoogleMapsReviewsScraper(debug=self.debug)
+                    self._reset_scraper()
                 except Exception as cleanup_error:
                     logger.error(
                         f"Error during scraper reinitialization: {str(cleanup_error)}")
                     raise
+
+    def get_place_metadata_many(self,
+                                urls: Iterable[str],
+                                return_exceptions: bool = False) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        Probe many places one after the other in this fetcher's browser.
+
+        Args:
+            urls (Iterable[str]): Google Maps URLs to probe
+            return_exceptions (bool): If True, a failed place yields its
+                exception instead of None
+
+        Yields:
+            Tuple[str, Optional[Dict]]: (url, metadata) per place, in urls order
+        """
+        for url in urls:
+            try:
+                yield url, self.get_place_metadata(url)
+            except Exception as e:
+                logger.error(f"Error probing {url}: {str(e)}")
+                yield url, e if return_exceptions else None
+
+    def get_reviews_if_changed(self,
+                               url: str,
+                               last_metadata: Optional[Dict],
+                               sort_by: SortBy = SortBy.NEWEST,
+                               max_reviews: int = 100) -> Tuple[Dict, Optional[List[Review]]]:
+        """
+        Probe a place and scrape it only if its review count changed.
+
+        Args:
+            url (str): Google Maps URL to scrape
+            last_metadata (Dict): get_place_metadata result of the last
+                scrape, None to always scrape
+            sort_by (SortBy): How to sort the reviews
+            max_reviews (int): Maximum number of reviews to fetch
+
+        Returns:
+            Tuple[Dict, Optional[List[Review]]]: The new metadata, and the
+                reviews or None if the count is unchanged. When the count
+                only grew and reviews are sorted NEWEST, just the new
+                reviews are scraped.
+        """
+        self.scrape_complete = False
+        metadata = self.get_place_metadata(url)
+        count, last_count = metadata['n_reviews'], (last_metadata or {}).get('n_reviews')
+        if count is not None and last_count is not None:
+            if count == last_count:
+                logger.info(f"Review count of {url} unchanged at {count}, skipping scrape")
+                PLACES_UNCHANGED_TOTAL.inc()
+                self.scrape_complete = True
+                return metadata, None
+            if count > last_count and sort_by == SortBy.NEWEST:
+                logger.info(f"{count - last_count} new reviews at {url}")
+                max_reviews = min(max_reviews, count - last_count)
+        reviews = self.get_reviews(url, sort_by, max_reviews)
+        self.scrape_complete = self.exhausted or len(reviews) >= max_reviews
+        return metadata, reviews
@@ -0,0 +1,197 @@
+# scraper_pool.py
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from scrapers.google_maps_reviews_scraper import GoogleMapsReviewsScraper
+logger = logging.getLogger(__name__)
+
+
+class _PoolEntry:
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self.created_at = time.monotonic()
+        self.uses = 0
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+
+class ScraperPool:
+    def __init__(self,
+                 size: int = 2,
+                 max_uses: int = 50,
+                 max_age: float = 1800,
+                 debug: bool = False,
+                 acquire_timeout: Optional[float] = None,
+                 scraper_options: Optional[Dict] = None,
+                 scraper_factory: Optional[Callable] = None):
+        """Bounded pool of pre-launched scrapers.
+
+        Args:
+            size (int): Maximum number of live scrapers (Chrome processes)
+            max_uses (int): Recycle a scraper after this many checkouts
+            max_age (float): Recycle a scraper after this many seconds
+            debug (bool): If True, runs browsers in visible mode
+            acquire_timeout (float): Default seconds to wait for a free scraper
+            scraper_options (Dict): Extra GoogleMapsReviewsScraper arguments
+            scraper_factory (Callable): Creates a new scraper, defaults to
+                GoogleMapsReviewsScraper
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.debug = debug
+        self.acquire_timeout = acquire_timeout
+        self.scraper_options = scraper_options or {}
+        self.scraper_factory = scraper_factory or (
+            lambda: GoogleMapsReviewsScraper(debug=self.debug, **self.scraper_options))
+
+        self._idle = deque()
+        self._entries: Dict[int, _PoolEntry] = {}
+        self._n_live = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def start(self):
+        """Launch the pool's scrapers in the background."""
+        threading.Thread(target=self.warm, daemon=True,
+                         name='scraper-pool-warmup').start()
+
+    def warm(self):
+        """Launch scrapers until the pool is full."""
+        while True:
+            with self._cond:
+                if self._closed or self._n_live >= self.size:
+                    return
+                self._n_live += 1
+            try:
+                entry = self._create()
+            except Exception as e:
+                logger.error(f"Failed to pre-launch scraper: {str(e)}")
+                return
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Check out a healthy scraper, launching one if the pool is not full.
+
+        Args:
+            timeout (float): Seconds to wait for a free scraper, defaults to
+                the pool's acquire_timeout (None waits forever)
+
+        Returns:
+            GoogleMapsReviewsScraper: A scraper owned by the caller until released
+        """
+        if timeout is None:
+            timeout = self.acquire_timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            entry = None
+            launch = False
+            with self._cond:
+                while not self._idle and self._n_live >= self.size:
+                    if self._closed:
+                        raise RuntimeError("Scraper pool is closed")
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(
+                            f"No scraper available after {timeout}s")
+                    self._cond.wait(remaining)
+
+                if self._closed:
+                    raise RuntimeError("Scraper pool is closed")
+                if self._idle:
+                    entry = self._idle.popleft()
+                else:
+                    self._n_live += 1
+                    launch = True
+
+            if launch:
+                return self._create().scraper
+
+            if self._is_expired(entry) or not entry.scraper.is_alive():
+                logger.info("Recycling expired or unhealthy pooled scraper")
+                self._destroy(entry)
+                continue
+
+            return entry.scraper
+
+    def release(self, scraper, discard: bool = False):
+        """
+        Return a scraper to the pool.
+
+        Args:
+            scraper: Scraper previously returned by acquire()
+            discard (bool): If True, the scraper is shut down instead of reused
+        """
+        with self._cond:
+            entry = self._entries.get(id(scraper))
+        if entry is None:
+            logger.warning("Released a scraper that does not belong to the pool")
+            scraper.cleanup()
+            return
+
+        entry.uses += 1
+        if discard or self._closed or self._is_expired(entry):
+            self._destroy(entry)
+            return
+
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def scraper(self, timeout: Optional[float] = None):
+        """Context manager that checks a scraper out and returns it afterwards."""
+        scraper = self.acquire(timeout)
+        try:
+            yield scraper
+        except Exception:
+            self.release(scraper, discard=True)
+            raise
+        self.release(scraper)
+
+    def close(self):
+        """Shut down every idle scraper and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in idle:
+            self._destroy(entry)
+
+    def _is_expired(self, entry: _PoolEntry) -> bool:
+        return entry.uses >= self.max_uses or entry.age >= self.max_age
+
+    def _create(self) -> _PoolEntry:
+        try:
+            entry = _PoolEntry(self.scraper_factory())
+        except Exception:
+            with self._cond:
+                self._n_live -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._entries[id(entry.scraper)] = entry
+        return entry
+
+    def _destroy(self, entry: _PoolEntry):
+        try:
+            entry.scraper.cleanup()
+        except Exception as e:
+            logger.error(f"Error shutting down pooled scraper: {str(e)}")
+        with self._cond:
+            self._entries.pop(id(entry.scraper), None)
+            self._n_live -= 1
+            self._cond.notify()
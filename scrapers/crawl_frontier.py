@@ -0,0 +1,135 @@
+# crawl_frontier.py
+"""Checkpoints of a place crawl, so a restarted crawl resumes where it stopped.
+
+Two append-only files are written as search points finish:
+
+    output CSV     one row per distinct place, in the order they were found
+    done log       one JSON line per finished search point: its keyword,
+                   cell, result count and whether it was split
+
+A point's places are appended before its done line. After a crash the point
+is searched again and its places, already in the CSV, are deduplicated.
+"""
+import csv
+import json
+import os
+from .geo_grid import Cell
+
+
+def _truncate_partial_line(path):
+    """Drop a last line left incomplete by a crash, so appends start clean."""
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def _point_key(keyword, cell):
+    return keyword, tuple(cell)
+
+
+class CrawlFrontier:
+    def __init__(self, log_path, output_path, columns, resume=False):
+        """
+        Args:
+            log_path (str): Done log, JSON lines
+            output_path (str): Places CSV
+            columns (list): Columns of the places CSV
+            resume (bool): If True, keep what the files hold and skip the
+                search points already done. If False, start both files over.
+        """
+        self.log_path = log_path
+        self.output_path = output_path
+        self.columns = columns
+        # Places already in the output, when resuming
+        self.places = []
+        self._done = set()
+        # Done points that were split, their children are due
+        self._split = {}
+
+        for path in (log_path, output_path):
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            if resume and os.path.exists(path):
+                _truncate_partial_line(path)
+        if resume:
+            self._load()
+
+        mode = 'a' if resume else 'w'
+        write_header = not resume or not os.path.exists(output_path) \
+            or os.path.getsize(output_path) == 0
+        self._log = open(log_path, mode, encoding='utf-8')
+        self._output = open(output_path, mode, encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._output, fieldnames=columns, extrasaction='ignore')
+        if write_header:
+            self._writer.writeheader()
+            self._output.flush()
+
+    def _load(self):
+        if os.path.exists(self.log_path):
+            with open(self.log_path, encoding='utf-8') as f:
+                for line in f:
+                    point = json.loads(line)
+                    cell = Cell(*point['cell'])
+                    key = _point_key(point['keyword'], cell)
+                    self._done.add(key)
+                    if point['split']:
+                        self._split[key] = (point['keyword'], cell)
+
+        if os.path.exists(self.output_path):
+            with open(self.output_path, encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    for column in ('latitude', 'longitude'):
+                        if column in row:
+                            row[column] = float(row[column]) if row[column] else None
+                    self.places.append(row)
+
+    @property
+    def n_done(self):
+        return len(self._done)
+
+    def pending(self, search_points):
+        """
+        The search points still to do: the given ones and the children of
+        split points, minus those done.
+
+        Args:
+            search_points (list): Initial (keyword, Cell) pairs
+
+        Returns:
+            list: (keyword, Cell) pairs
+        """
+        pending = []
+        stack = list(reversed(search_points))
+        while stack:
+            keyword, cell = stack.pop()
+            key = _point_key(keyword, cell)
+            if key not in self._done:
+                pending.append((keyword, cell))
+            elif key in self._split:
+                stack.extend((keyword, child) for child in reversed(cell.split()))
+        return pending
+
+    def record(self, keyword, cell, n_results, new_places, split):
+        """
+        Append the new places of a finished search point, then mark it done.
+
+        Args:
+            keyword (str): Search keyword
+            cell (Cell): Searched cell
+            n_results (int): Places the point listed, new or not
+            new_places (list): Places not found before
+            split (bool): Whether the cell's children are searched too
+        """
+        self._writer.writerows(new_places)
+        self._output.flush()
+        self._log.write(json.dumps({'keyword': keyword, 'cell': list(cell),
+                                    'n_results': n_results, 'split': split}) + '\n')
+        self._log.flush()
+        key = _point_key(keyword, cell)
+        self._done.add(key)
+        if split:
+            self._split[key] = (keyword, cell)
+
+    def close(self):
+        self._log.close()
+        self._output.close()
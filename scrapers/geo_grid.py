@@ -0,0 +1,127 @@
+# geo_grid.py
+"""Search points over a bounding box, and deduplication of the places found.
+
+A box is split into a grid of cells, each searched from its center at a zoom
+where the map shows about the whole cell. Maps lists at most ~120 results per
+search, so cells that come back (nearly) full are split in four and searched
+again, down to max_depth.
+"""
+import math
+import re
+from collections import namedtuple
+from urllib.parse import quote
+
+SEARCH_URL = 'https://www.google.com/maps/search/{keyword}/@{latitude},{longitude},{zoom}z'
+# Degrees of longitude a ~1000px wide map shows at zoom 0
+VIEWPORT_DEGREES = 1440
+MIN_ZOOM = 3
+MAX_ZOOM = 20
+
+FEATURE_ID_RE = re.compile(r'!1s(0x[0-9a-f]+:0x[0-9a-f]+)')
+COORDINATES_RE = re.compile(r'!3d(-?\d+(?:\.\d+)?)!4d(-?\d+(?:\.\d+)?)')
+
+
+class Cell(namedtuple('Cell', ['south', 'west', 'north', 'east', 'depth'])):
+    @property
+    def center(self):
+        return (self.south + self.north) / 2, (self.west + self.east) / 2
+
+    @property
+    def zoom(self):
+        """Zoom level at which the map shows about the whole cell."""
+        span = max(self.east - self.west, self.north - self.south, 1e-6)
+        return max(MIN_ZOOM, min(MAX_ZOOM, int(math.log2(VIEWPORT_DEGREES / span))))
+
+    def split(self):
+        """The four quarters of the cell, one level deeper."""
+        latitude, longitude = self.center
+        return [Cell(south, west, north, east, self.depth + 1)
+                for south, north in ((self.south, latitude), (latitude, self.north))
+                for west, east in ((self.west, longitude), (longitude, self.east))]
+
+    def search_url(self, keyword):
+        latitude, longitude = self.center
+        return SEARCH_URL.format(keyword=quote(keyword), latitude=round(latitude, 6),
+                                 longitude=round(longitude, 6), zoom=self.zoom)
+
+
+def grid(south, west, north, east, rows, cols):
+    """
+    Split a bounding box in rows x cols cells.
+
+    Returns:
+        list: The cells, south-west first
+    """
+    height = (north - south) / rows
+    width = (east - west) / cols
+    return [Cell(south + row * height, west + col * width,
+                 south + (row + 1) * height, west + (col + 1) * width, 0)
+            for row in range(rows) for col in range(cols)]
+
+
+def place_key(href):
+    """Identity of a place link: its feature id, else the link without its query."""
+    match = FEATURE_ID_RE.search(href)
+    return match.group(1) if match else href.split('?')[0]
+
+
+def place_coordinates(href):
+    """(latitude, longitude) encoded in a place link, or None."""
+    match = COORDINATES_RE.search(href)
+    return (float(match.group(1)), float(match.group(2))) if match else None
+
+
+class PlaceIndex:
+    """Places found so far, by link and by location.
+
+    The same place found from overlapping search points has the same feature
+    id. Links without one are matched by name within radius degrees
+    (about 20 m by default), looked up in a grid of radius-sized buckets.
+    """
+
+    def __init__(self, radius=0.0002):
+        self.radius = radius
+        self._keys = set()
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, place):
+        """
+        Args:
+            place (dict): Place with 'href', 'name' and optional
+                'latitude'/'longitude'
+
+        Returns:
+            bool: True if the place is new
+        """
+        key = place_key(place['href'])
+        if key in self._keys:
+            return False
+
+        if place.get('latitude') is not None:
+            name = (place.get('name') or '').strip().lower()
+            bucket = (math.floor(place['latitude'] / self.radius),
+                      math.floor(place['longitude'] / self.radius))
+            # Distinct feature ids are distinct places, even with the same
+            # name next door (two branches of a chain in one mall)
+            if not FEATURE_ID_RE.search(place['href']) and self._near(name, place, bucket):
+                return False
+            self._buckets.setdefault(bucket, []).append(
+                (name, place['latitude'], place['longitude']))
+
+        self._keys.add(key)
+        return True
+
+    def _near(self, name, place, bucket):
+        """Whether a place of that name was found within radius of place."""
+        for d_lat in (-1, 0, 1):
+            for d_lng in (-1, 0, 1):
+                for other_name, latitude, longitude in self._buckets.get(
+                        (bucket[0] + d_lat, bucket[1] + d_lng), ()):
+                    if (other_name == name
+                            and abs(latitude - place['latitude']) <= self.radius
+                            and abs(longitude - place['longitude']) <= self.radius):
+                        return True
+        return False
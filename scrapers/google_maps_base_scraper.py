@@ -5,25 +5,81 @@ from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 import os
+import json
+import shutil
+import threading
+import time
 import uuid
 import gc
 import atexit
+from collections import namedtuple
+from .metrics import LIVE_DRIVERS, PHASE_SECONDS
+from .session_recording import ReplayDriver
+
+# Yielded by step generators (see _run_steps): poll condition with the driver
+# until it returns a truthy value, which is sent back, or timeout elapses
+Wait = namedtuple('Wait', ['name', 'condition', 'timeout'])
 
 
 class GoogleMapsBaseScraper:
     GM_WEBPAGE = 'https://www.google.com/maps/'
+    # SessionRecorder of the scrape being recorded, if any
+    recorder = None
     MAX_WAIT = 10
+    POLL_INTERVAL = 0.2
+    CONSENT_BUTTON_XPATH = '//span[contains(text(), "Reject all")]'
+    # Profile with the cookie consent already given, built once by the first
+    # scraper that asks for it and copied into each new browser's profile
+    PROFILE_TEMPLATE_DIR = '/tmp/chrome-profile-template'
+    # Caches and files of the running browser, not worth copying
+    PROFILE_TEMPLATE_IGNORE = (
+        'Cache', 'Code Cache', 'GPUCache', 'DawnCache', 'GrShaderCache', 'ShaderCache',
+        'GraphiteDawnCache', 'Service Worker', 'Crashpad', 'BrowserMetrics*',
+        'Singleton*', 'DevToolsActivePort', 'lockfile', '*.lock')
+    _profile_template_lock = threading.Lock()
+    # Requests dropped in resource-blocking mode. Only text and the avatar
+    # src attribute are read, so none of these are needed.
+    BLOCKED_URL_PATTERNS = [
+        # Images, avatars and place photos
+        '*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.ico*', '*.svg*',
+        '*googleusercontent.com/*', '*gstatic.com/images/*', '*/maps/vt/icon*',
+        # Web fonts
+        '*.woff*', '*.ttf*', '*.otf*', '*fonts.gstatic.com*', '*fonts.googleapis.com*',
+        # Media
+        '*.mp4*', '*.webm*', '*.mp3*',
+        # Map and satellite tiles, street view
+        '*/maps/vt?*', '*/maps/vt/pb=*', '*/kh/v=*', '*khms*.google.com*',
+        '*streetviewpixels-pa.googleapis.com*', '*/maps/preview/tile*',
+    ]
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, block_resources=False, profile_template=False,
+                 driver=None):
+        """
+        Args:
+            debug (bool): If True, runs browser in visible mode
+            block_resources (bool): If True, images, fonts, media and map
+                tiles are not downloaded
+            profile_template (bool): If True, the browser starts from a copy
+                of PROFILE_TEMPLATE_DIR, so the cookie banner never shows up
+            driver (WebDriver): Use this driver instead of launching Chrome,
+                e.g. a ReplayDriver
+        """
         self.debug = debug
+        self.block_resources = block_resources
+        self.profile_template = profile_template
+        # Blocked request counts by resource type (Image, Font, ...)
+        self.blocked_requests = {}
         self.driver = None
+        self.last_waits = {}
         self.user_data_dir = None
         self.logger = self.__get_logger()
         # Register cleanup on program exit
         atexit.register(self.cleanup)
         # Initialize driver
-        self.driver = self.__get_driver()
+        self.launched_driver = driver is None
+        self.driver = driver or self.__get_driver()
 
     def __enter__(self):
         return self
@@ -36,14 +92,25 @@ class GoogleMapsBaseScraper:
         """Cleanup resources and force garbage collection"""
         try:
             if self.driver:
-                self.driver.close()
-                self.driver.quit()
-                self.driver = None
+                try:
+                    try:
+                        self.driver.close()
+                    except Exception as e:
+                        # A crashed browser has no window left to close,
+                        # quit still stops chromedriver and Chrome
+                        self.logger.warning(f"Failed to close the browser window: {e}")
+                    self.driver.quit()
+                except Exception as e:
+                    self.logger.error(f"Failed to quit the browser: {e}")
+                finally:
+                    # Released even if the browser crashed and quit failed
+                    self.driver = None
+                    if self.launched_driver:
+                        LIVE_DRIVERS.dec()
 
             # Clean up user data directory if it exists
             if self.user_data_dir and os.path.exists(self.user_data_dir):
                 try:
-                    import shutil
                     shutil.rmtree(self.user_data_dir)
                 except Exception as e:
                     self.logger.warning(
@@ -55,16 +122,31 @@ class GoogleMapsBaseScraper:
         except Exception as e:
             self.logger.error(f"Error during cleanup: {e}")
 
-    def __get_driver(self):
+    def _restart_driver(self):
+        """Replace a broken browser with a freshly launched one."""
+        self.cleanup()
+        self.launched_driver = True
+        self.driver = self.__get_driver()
+
+    def is_alive(self):
+        """Check that the browser session still responds"""
+        if not self.driver:
+            return False
+        try:
+            self.driver.execute_script('return 1')
+            return True
+        except Exception as e:
+            self.logger.warning(f"Driver health check failed: {e}")
+            return False
+
+    def _chrome_options(self, user_data_dir):
         options = ChromeOptions()
         if not self.debug:
             options.add_argument("--headless")
         else:
             options.add_argument("--window-size=1366,768")
 
-        # Add unique user data directory
-        self.user_data_dir = f"/tmp/chrome-data-{uuid.uuid4()}"
-        options.add_argument(f"--user-data-dir={self.user_data_dir}")
+        options.add_argument(f"--user-data-dir={user_data_dir}")
 
         # Additional Chrome options for stability
         options.add_argument("--no-sandbox")
@@ -72,16 +154,127 @@ class GoogleMapsBaseScraper:
         options.add_argument("--disable-gpu")
         options.add_argument("--disable-notifications")
         options.add_argument("--accept-lang=en-GB")
+        # Keep tabs that are not in front running at full speed, see TabScheduler
+        options.add_argument("--disable-background-timer-throttling")
+        options.add_argument("--disable-backgrounding-occluded-windows")
+        options.add_argument("--disable-renderer-backgrounding")
+        return options
+
+    def __get_driver(self):
+        # Add unique user data directory
+        self.user_data_dir = f"/tmp/chrome-data-{uuid.uuid4()}"
+        options = self._chrome_options(self.user_data_dir)
+
+        if self._needs_network_events():
+            options.set_capability(
+                'goog:loggingPrefs', {'performance': 'ALL'})
 
+        driver = None
         try:
-            driver = webdriver.Chrome(service=Service(), options=options)
-            driver.get(self.GM_WEBPAGE)
+            with PHASE_SECONDS.time(phase='driver_startup'):
+                if self.profile_template:
+                    self._clone_profile_template(self.user_data_dir)
+                driver = webdriver.Chrome(service=Service(), options=options)
+                LIVE_DRIVERS.inc()
+                self._setup_network(driver)
+                driver.get(self.GM_WEBPAGE)
             return driver
         except Exception as e:
             self.logger.error(f"Failed to initialize driver: {e}")
+            if driver is not None:
+                # Not self.driver yet, so cleanup would not release it
+                try:
+                    driver.quit()
+                except Exception as quit_error:
+                    self.logger.error(f"Failed to quit the browser: {quit_error}")
+                finally:
+                    LIVE_DRIVERS.dec()
             self.cleanup()
             raise
 
+    def _setup_network(self, driver):
+        """DevTools network setup. It applies to the current tab only, so
+        every new tab needs it too."""
+        if self._needs_network_events():
+            driver.execute_cdp_cmd('Network.enable', {})
+        if self.block_resources:
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {
+                'urls': self.BLOCKED_URL_PATTERNS})
+
+    def _clone_profile_template(self, user_data_dir):
+        with self._profile_template_lock:
+            if not os.path.isdir(self.PROFILE_TEMPLATE_DIR):
+                try:
+                    self._build_profile_template()
+                except Exception as e:
+                    self.logger.warning(
+                        f"Failed to build the profile template, starting from an empty profile: {e}")
+                    return
+        shutil.copytree(self.PROFILE_TEMPLATE_DIR, user_data_dir,
+                        ignore=shutil.ignore_patterns(*self.PROFILE_TEMPLATE_IGNORE))
+
+    def _build_profile_template(self):
+        """Give the cookie consent once in a fresh profile and keep it as
+        PROFILE_TEMPLATE_DIR."""
+        start = time.monotonic()
+        build_dir = f"{self.PROFILE_TEMPLATE_DIR}-{uuid.uuid4()}"
+        driver = webdriver.Chrome(service=Service(), options=self._chrome_options(build_dir))
+        try:
+            driver.get(self.GM_WEBPAGE)
+            try:
+                WebDriverWait(driver, self.MAX_WAIT).until(EC.element_to_be_clickable(
+                    (By.XPATH, self.CONSENT_BUTTON_XPATH))).click()
+                # The consent is stored as a cookie once the page reloads
+                WebDriverWait(driver, self.MAX_WAIT).until(
+                    lambda d: d.find_elements(By.XPATH, self.CONSENT_BUTTON_XPATH) == [])
+            except TimeoutException:
+                self.logger.info("No cookie banner while building the profile template")
+        finally:
+            driver.quit()
+
+        try:
+            # Atomic, if another process built a template first, keep theirs
+            os.rename(build_dir, self.PROFILE_TEMPLATE_DIR)
+        except OSError:
+            shutil.rmtree(build_dir, ignore_errors=True)
+        self.logger.info(
+            f"Built profile template {self.PROFILE_TEMPLATE_DIR} in {time.monotonic() - start:.2f}s")
+
+    def _needs_network_events(self):
+        return self.block_resources
+
+    def _read_network_events(self):
+        """
+        Drain the browser's performance log and update blocked_requests.
+
+        Returns:
+            list: DevTools Network.* events as {'method': ..., 'params': ...}
+        """
+        if not self._needs_network_events():
+            return []
+
+        events = []
+        for entry in self.driver.get_log('performance'):
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            if not message.get('method', '').startswith('Network.'):
+                continue
+            events.append(message)
+
+            params = message.get('params', {})
+            if message['method'] == 'Network.loadingFailed' and params.get('blockedReason'):
+                resource_type = params.get('type', 'Other')
+                self.blocked_requests[resource_type] = self.blocked_requests.get(
+                    resource_type, 0) + 1
+        return events
+
+    def get_blocked_request_counts(self):
+        """Blocked request counts by resource type, since the driver started."""
+        self._read_network_events()
+        return dict(self.blocked_requests)
+
     def __get_logger(self):
         logger = logging.getLogger('googlemaps-scraper')
         logger.setLevel(logging.DEBUG)
@@ -93,11 +286,84 @@ class GoogleMapsBaseScraper:
         logger.addHandler(fh)
         return logger
 
+    def _wait_for(self, name, condition, timeout):
+        """
+        Poll condition until it returns a truthy value or timeout elapses.
+
+        Args:
+            name (str): Name of the wait, used for logging and last_waits
+            condition (callable): Called with the driver on every poll
+            timeout (float): Upper bound in seconds
+
+        Returns:
+            tuple: (condition result or None on timeout, seconds waited)
+        """
+        polls = 0
+
+        def polled(driver):
+            nonlocal polls
+            polls += 1
+            return condition(driver)
+
+        start = time.monotonic()
+        if isinstance(self.driver, ReplayDriver):
+            result = self.driver.replay_wait(name, polled)
+        else:
+            try:
+                result = WebDriverWait(
+                    self.driver, timeout, poll_frequency=self.POLL_INTERVAL).until(polled)
+            except TimeoutException:
+                result = None
+        elapsed = time.monotonic() - start
+
+        if self.recorder:
+            self.recorder.add_wait(name, polls)
+        self.last_waits[name] = elapsed
+        PHASE_SECONDS.observe(elapsed, phase=f'wait_{name}')
+        self.logger.debug(
+            f"Wait '{name}' took {elapsed:.2f}s (timeout {timeout}s, "
+            f"{'satisfied' if result else 'timed out'})")
+        return result, elapsed
+
+    def _run_steps(self, steps):
+        """
+        Run a step generator in the current tab, blocking on each Wait it
+        yields. TabScheduler runs the same generators without blocking.
+
+        Returns:
+            The generator's return value
+        """
+        result = None
+        while True:
+            try:
+                wait = steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result, _ = self._wait_for(wait.name, wait.condition, wait.timeout)
+
     def _click_on_cookie_agreement(self):
+        """
+        Reject cookies if the consent banner is shown. The banner is part of
+        the loaded page, so when it is missing this returns right away.
+
+        Returns:
+            bool: True if the banner was clicked
+        """
         try:
-            agree = WebDriverWait(self.driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, '//span[contains(text(), "Reject all")]')))
-            agree.click()
+            with PHASE_SECONDS.time(phase='cookie_consent'):
+                buttons = self.driver.find_elements(By.XPATH, self.CONSENT_BUTTON_XPATH)
+                if buttons:
+                    agree = buttons[0]
+                elif 'consent.google' in self.driver.current_url:
+                    # Consent page still rendering
+                    agree, _ = self._wait_for('cookie_consent', EC.element_to_be_clickable(
+                        (By.XPATH, self.CONSENT_BUTTON_XPATH)), self.MAX_WAIT)
+                    if agree is None:
+                        self.logger.warning("Cookie agreement button not found")
+                        return False
+                else:
+                    return False
+                agree.click()
             return True
         except Exception as e:
             self.logger.warning(f"Failed to click cookie agreement: {e}")
@@ -0,0 +1,138 @@
+# google_maps_http_scraper.py
+import logging
+import re
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from .review_parsers import RawBatch, ReviewFieldsMixin
+from .review_payloads import decode_reviews_payload
+from .metrics import PHASE_SECONDS
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_shared_session(pool_maxsize=10):
+    """requests.Session shared by every HTTP scraper, so connections to
+    Google are kept alive and reused across scrapes."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session.headers.update({
+                'User-Agent': GoogleMapsHttpScraper.USER_AGENT,
+                'Accept-Language': 'en-GB,en;q=0.9',
+            })
+            # Pre-answered cookie consent, so EU requests are not redirected
+            _session.cookies.set('SOCS', 'CAESEwgDEgk0ODE3Nzk3MjQaAmVuIAEaBgiA_LyaBg',
+                                 domain='.google.com')
+        return _session
+
+
+class GoogleMapsHttpScraper(ReviewFieldsMixin):
+    """Browserless backend: pages through the review list with plain HTTP
+    requests, following the continuation token of the previous page.
+
+    Exposes the same sort_by/get_reviews/fetch_raw_batch/parse_raw_batch/cleanup
+    interface as GoogleMapsReviewsScraper and returns identical review dicts.
+    """
+    BASE_URL = 'https://www.google.com'
+    REVIEWS_PATH = '/maps/rpc/listugcposts'
+    PAGE_SIZE = 10
+    TIMEOUT = 15
+    USER_AGENT = ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36')
+    # Feature id of a place ("0x...:0x..."), embedded in its page source
+    FEATURE_ID_RE = re.compile(r'(0x[0-9a-f]{6,}:0x[0-9a-f]{6,})')
+    # Protobuf-style query of listugcposts: place, page size, page token and
+    # sort order (1 most relevant, 2 newest, 3 highest, 4 lowest rating)
+    REVIEWS_PB = ('!1m6!1s{feature_id}!6m4!4m1!1e1!4m1!1e3!2m2!1i{page_size}!2s{token}'
+                  '!5m2!1s{session_id}!7e81!8m5!1b1!2b1!3b1!5b1!7b1!11m6!1e3!2e{sort}!3s{lang}!6m1!1i2')
+
+    def __init__(self, debug=False, base_url=None, session=None, lang='en'):
+        """
+        Args:
+            debug (bool): Unused, accepted for interface parity with the
+                Selenium backend
+            base_url (str): Host to query, defaults to BASE_URL
+            session (requests.Session): Session to use, defaults to the
+                shared pooled session
+            lang (str): Language of the returned reviews
+        """
+        self.debug = debug
+        self.base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.session = session or get_shared_session()
+        self.lang = lang
+        self.logger = logging.getLogger('googlemaps-scraper')
+        self._reset(None, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.cleanup()
+        return True
+
+    def cleanup(self):
+        """Nothing to release, the session is shared"""
+        self._reset(None, 0)
+
+    def is_alive(self):
+        return True
+
+    def sort_by(self, url, ind):
+        self._start_scrape()
+        feature_id = self._get_feature_id(url)
+        if not feature_id:
+            self.logger.warning(f'Could not find the feature id of {url}')
+            return -1
+        self._reset(feature_id, ind)
+        return 0
+
+    def get_reviews(self, offset):
+        return self.parse_raw_batch(self.fetch_raw_batch(offset))
+
+    def fetch_raw_batch(self, offset):
+        while len(self._fetched) <= offset and not self._exhausted:
+            with PHASE_SECONDS.time(phase='page_fetch'):
+                self._fetch_page()
+        return RawBatch('json', self._fetched[offset:])
+
+    def _reset(self, feature_id, ind):
+        self._feature_id = feature_id
+        self._sort = ind + 1
+        self._token = ''
+        self._fetched = []
+        self._exhausted = feature_id is None
+
+    def _get_feature_id(self, url):
+        url = re.sub(r'^https?://[^/]+', self.base_url, url)
+        response = self.session.get(url, timeout=self.TIMEOUT)
+        response.raise_for_status()
+        match = self.FEATURE_ID_RE.search(response.text)
+        return match.group(1) if match else None
+
+    def _fetch_page(self):
+        response = self.session.get(
+            self.base_url + self.REVIEWS_PATH,
+            params={
+                'authuser': 0,
+                'hl': self.lang,
+                'pb': self.REVIEWS_PB.format(
+                    feature_id=self._feature_id,
+                    page_size=self.PAGE_SIZE,
+                    token=self._token,
+                    session_id='',
+                    sort=self._sort,
+                    lang=self.lang),
+            },
+            timeout=self.TIMEOUT)
+        response.raise_for_status()
+
+        reviews, token = decode_reviews_payload(response.text)
+        self._fetched.extend(reviews)
+        self._token = token or ''
+        self._exhausted = not token or not reviews
@@ -1,32 +1,109 @@
 # google_maps_places_scraper.py
 from bs4 import BeautifulSoup
-from selenium.common.exceptions import NoSuchElementException
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.common.by import By
 import pandas as pd
 import itertools
+import queue
 import time
 from .google_maps_base_scraper import GoogleMapsBaseScraper
+from .crawl_frontier import CrawlFrontier
+from .geo_grid import PlaceIndex, grid, place_coordinates
 
+PLACE_COLUMNS = ['search_point_url', 'href', 'name', 'latitude', 'longitude']
 
-class GoogleMapsPlacesScraper(GoogleMapsBaseScraper):
-
-    def get_places(self, keyword_list=None):
-        df_places = pd.DataFrame()
-        search_point_url_list = self._gen_search_points_from_square(
-            keyword_list=keyword_list)
-
-        for i, search_point_url in enumerate(search_point_url_list):
-            try:
-                places_data = self._scrape_places_from_url(search_point_url)
-                df_places = df_places.append(places_data, ignore_index=True)
 
-                if (i+1) % 10 == 0:
-                    self._save_places_data(df_places)
-            except Exception as e:
-                self.logger.error(
-                    f"Error scraping {search_point_url}: {str(e)}")
-
-        return df_places
+class GoogleMapsPlacesScraper(GoogleMapsBaseScraper):
+    # Rows of city, latitude, longitude; each city's points span its box
+    SQUARE_POINTS_CSV = 'input/square_points.csv'
+    OUTPUT_CSV = 'output/places_wax.csv'
+    # Search points done so far, see CrawlFrontier
+    DONE_LOG = 'output/places_wax.done.jsonl'
+    GRID_SIZE = 20
+    # Maps lists at most ~120 results per search, a search point with at
+    # least this many likely missed some and its cell is split
+    DENSE_RESULTS = 100
+    MAX_DEPTH = 3
+
+    def get_places(self, keyword_list=None, bbox=None, n_drivers=1, grid_size=None,
+                   max_depth=None, resume=False):
+        """
+        Find the places matching each keyword over a bounding box.
+
+        Args:
+            keyword_list (list): Search keywords
+            bbox (tuple): (south, west, north, east), defaults to the box of
+                each city in SQUARE_POINTS_CSV
+            n_drivers (int): Search points scraped in parallel, each in its
+                own browser. This scraper's browser is one of them.
+            grid_size (int): The box is first split in grid_size x grid_size
+                cells, defaults to GRID_SIZE
+            max_depth (int): Times a dense cell may be split in four,
+                defaults to MAX_DEPTH
+            resume (bool): If True, continue the crawl in OUTPUT_CSV and
+                DONE_LOG, skipping the search points already done. Use the
+                same keywords and box as the interrupted crawl. If False,
+                both files are started over.
+
+        Returns:
+            pd.DataFrame: One row per distinct place, from earlier runs too
+                when resuming
+        """
+        max_depth = self.MAX_DEPTH if max_depth is None else max_depth
+        frontier = CrawlFrontier(self.DONE_LOG, self.OUTPUT_CSV, PLACE_COLUMNS, resume)
+        index = PlaceIndex()
+        places = [place for place in frontier.places if index.add(place)]
+        search_points = frontier.pending(
+            self._gen_search_points_from_square(keyword_list, bbox, grid_size))
+        if resume:
+            self.logger.info(
+                f"Resuming the crawl: {frontier.n_done} search points done, "
+                f"{len(places)} places found, {len(search_points)} points to go")
+
+        # Browsers not in use, each search point takes one
+        scrapers = queue.Queue()
+        scrapers.put(self)
+        extra_scrapers = []
+        try:
+            for _ in range(n_drivers - 1):
+                extra_scrapers.append(type(self)(
+                    debug=self.debug, block_resources=self.block_resources,
+                    profile_template=self.profile_template))
+                scrapers.put(extra_scrapers[-1])
+
+            with ThreadPoolExecutor(max_workers=n_drivers,
+                                    thread_name_prefix='places-search') as executor:
+                pending = {executor.submit(self._search, scrapers, keyword, cell): (keyword, cell)
+                           for keyword, cell in search_points}
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        keyword, cell = pending.pop(future)
+                        try:
+                            found = future.result()
+                        except Exception as e:
+                            self.logger.error(
+                                f"Error scraping {cell.search_url(keyword)}: {str(e)}")
+                            continue
+
+                        new_places = [place for place in found if index.add(place)]
+                        places.extend(new_places)
+                        split = len(found) >= self.DENSE_RESULTS and cell.depth < max_depth
+                        frontier.record(keyword, cell, len(found), new_places, split)
+                        if split:
+                            self.logger.info(
+                                f"{len(found)} results at {cell.search_url(keyword)}, "
+                                f"splitting the cell")
+                            for child in cell.split():
+                                pending[executor.submit(
+                                    self._search, scrapers, keyword, child)] = (keyword, child)
+        finally:
+            frontier.close()
+            for scraper in extra_scrapers:
+                scraper.cleanup()
+
+        return pd.DataFrame(places, columns=PLACE_COLUMNS)
 
     def get_place_details(self, url):
         self.driver.get(url)
@@ -36,12 +113,21 @@ class GoogleMapsPlacesScraper(GoogleMapsBaseScraper):
         response = BeautifulSoup(self.driver.page_source, 'html.parser')
         return self._parse_place(response, url)
 
+    @staticmethod
+    def _search(scrapers, keyword, cell):
+        """Scrape one search point with the first free browser."""
+        scraper = scrapers.get()
+        try:
+            return scraper._scrape_places_from_url(cell.search_url(keyword))
+        finally:
+            scrapers.put(scraper)
+
     def _scrape_places_from_url(self, url):
         try:
             self.driver.get(url)
-        except NoSuchElementException:
-            self.driver.quit()
-            self.driver = self._get_driver()
+        except WebDriverException as e:
+            self.logger.warning(f"Restarting the browser after: {e}")
+            self._restart_driver()
             self.driver.get(url)
 
         self._scroll_results()
@@ -65,23 +151,38 @@ class GoogleMapsPlacesScraper(GoogleMapsBaseScraper):
             time.sleep(0.5)
 
     def _parse_place_basic_info(self, div_place, search_url):
+        coordinates = place_coordinates(div_place['href']) or (None, None)
         return {
             'search_point_url': search_url.replace(
                 'https://www.google.com/maps/search/', ''
             ),
             'href': div_place['href'],
-            'name': div_place['aria-label']
+            'name': div_place['aria-label'],
+            'latitude': coordinates[0],
+            'longitude': coordinates[1],
         }
 
     def _parse_place(self, response, url):
         # ... (keep the existing __parse_place method, but rename it)
         pass
 
-    def _gen_search_points_from_square(self, keyword_list=None):
-        # ... (keep the existing _gen_search_points_from_square method)
-        pass
-
-    @staticmethod
-    def _save_places_data(df_places):
-        df_places = df_places[['search_point_url', 'href', 'name']]
-        df_places.to_csv('output/places_wax.csv', index=False)
+    def _gen_search_points_from_square(self, keyword_list=None, bbox=None, grid_size=None):
+        """
+        Initial search points: every keyword at every cell of the grid.
+
+        Returns:
+            list: (keyword, Cell) pairs
+        """
+        keyword_list = [] if keyword_list is None else keyword_list
+        grid_size = grid_size or self.GRID_SIZE
+
+        if bbox is not None:
+            boxes = [bbox]
+        else:
+            square_points = pd.read_csv(self.SQUARE_POINTS_CSV)
+            boxes = [(points['latitude'].min(), points['longitude'].min(),
+                      points['latitude'].max(), points['longitude'].max())
+                     for _, points in square_points.groupby('city')]
+
+        cells = [cell for box in boxes for cell in grid(*box, grid_size, grid_size)]
+        return list(itertools.product(keyword_list, cells))
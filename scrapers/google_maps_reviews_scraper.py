@@ -1,34 +1,180 @@
 # google_maps_reviews_scraper.py
-from datetime import datetime
-from bs4 import BeautifulSoup
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import time
-from .google_maps_base_scraper import GoogleMapsBaseScraper
+from .google_maps_base_scraper import GoogleMapsBaseScraper, Wait
+from .review_parsers import RawBatch, ReviewFieldsMixin, get_review_parser
+from .review_payloads import decode_reviews_payload, is_review_response
+from .metrics import PHASE_SECONDS
+from .session_recording import ReplayDriver, SessionArchive, SessionRecorder
+import base64
 import re
-from datetime import datetime, timedelta
+from datetime import datetime
 
 
-class GoogleMapsReviewsScraper(GoogleMapsBaseScraper):
+class GoogleMapsReviewsScraper(ReviewFieldsMixin, GoogleMapsBaseScraper):
     MAX_RETRY = 5
     MAX_SCROLLS = 40
+    SCROLL_TIMEOUT = 4
+    SORT_TIMEOUT = 5
+    SCROLLABLE_SELECTOR = 'div.m6QErb.DxyBCb.kA9KIf.dS8AEf'
+    REVIEW_BLOCK_SELECTOR = 'div.jftiEf.fontBodyMedium'
+    # Loading placeholder at the bottom of the review list. Maps keeps it in
+    # the pane while more pages exist and drops it once the list is complete.
+    REVIEWS_LOADING_SELECTOR = 'div.lXJj5c'
+    SCROLL_JS = (
+        'arguments[0].scrollTop = arguments[0].scrollHeight;'
+        'return document.querySelectorAll("%s").length;'
+    ) % REVIEW_BLOCK_SELECTOR
+    REVIEWS_STATE_JS = (
+        'return [document.querySelectorAll("%s").length,'
+        ' document.querySelector("%s") === null];'
+    ) % (REVIEW_BLOCK_SELECTOR, REVIEWS_LOADING_SELECTOR)
+    NEW_REVIEW_BLOCKS_JS = (
+        'var blocks = document.querySelectorAll("%s");'
+        'return Array.prototype.slice.call(blocks, arguments[0])'
+        '.map(function (block) { return block.outerHTML; });'
+    ) % REVIEW_BLOCK_SELECTOR
+    # Hollowed review blocks keep their class, so counts and offsets still
+    # hold, and their height, so the scroll position and the scroll-triggered
+    # loading of the next page are unchanged
+    HOLLOW_BLOCKS_JS = (
+        'var heights = blocks.map(function (block) { return block.offsetHeight; });'
+        'blocks.forEach(function (block, i) {'
+        ' block.style.boxSizing = "border-box";'
+        ' block.style.height = heights[i] + "px";'
+        ' block.replaceChildren();'
+        ' block.setAttribute("data-gm-hollow", "");'
+        '});'
+    )
+    # NEW_REVIEW_BLOCKS_JS, then hollow the serialized blocks
+    PRUNE_NEW_REVIEW_BLOCKS_JS = (
+        'var blocks = Array.prototype.slice.call('
+        'document.querySelectorAll("%s"), arguments[0]);'
+        'var html = blocks.map(function (block) { return block.outerHTML; });'
+        '%s'
+        'return html;'
+    ) % (REVIEW_BLOCK_SELECTOR, HOLLOW_BLOCKS_JS)
+    # All review blocks not hollowed yet, when reviews come from the network
+    PRUNE_REVIEW_BLOCKS_JS = (
+        'var blocks = Array.prototype.slice.call('
+        'document.querySelectorAll("%s:not([data-gm-hollow])"));'
+        '%s'
+    ) % (REVIEW_BLOCK_SELECTOR, HOLLOW_BLOCKS_JS)
+
+    # Place header: name, then e.g. "4.6(2,345)" for the rating and count
+    PLACE_HEADER_JS = (
+        'var name = document.querySelector("h1.DUwDvf");'
+        'var summary = document.querySelector("div.F7nice");'
+        'return [name && name.textContent, summary && summary.textContent];'
+    )
+    # The rating leads the summary, a place without one shows only the count
+    RATING_RE = re.compile(r'^\s*(\d[.,]\d)')
+    REVIEW_COUNT_RE = re.compile(r'\(([\d.,\s\u202f\xa0]+)\)')
+
+    def __init__(self, debug=False, wait_timeout=None, parser=None,
+                 block_resources=False, capture_network=False, record_to=None,
+                 profile_template=False, prune_dom=False, driver=None):
+        """
+        Args:
+            debug (bool): If True, runs browser in visible mode
+            wait_timeout (float): Upper bound in seconds for each wait after a
+                scroll, defaults to SCROLL_TIMEOUT
+            parser (str): Review parser backend, 'lxml' or 'bs4', defaults to
+                the fastest one installed
+            block_resources (bool): If True, images, fonts, media and map
+                tiles are not downloaded
+            capture_network (bool): If True, reviews are decoded from the
+                review page responses instead of parsed from the DOM
+            record_to (str): If given, every scrape (sort_by up to the next
+                sort_by or cleanup) is saved as a session archive in this
+                directory, see session_recording
+            profile_template (bool): If True, the browser starts from a copy
+                of a profile where the cookie consent is already given
+            prune_dom (bool): If True, review blocks are emptied in the page
+                once read, so the page and each batch do not grow with the
+                number of reviews scraped
+            driver (WebDriver): Use this driver instead of launching Chrome
+        """
+        self.wait_timeout = wait_timeout or self.SCROLL_TIMEOUT
+        self.parser = get_review_parser(parser)
+        self.capture_network = capture_network
+        self.prune_dom = prune_dom
+        # Raw fields of every review captured since the last sort_by
+        self._captured_reviews = []
+        # Review responses whose body is not fully loaded yet
+        self._pending_responses = set()
+        super().__init__(debug=debug, block_resources=block_resources,
+                         profile_template=profile_template, driver=driver)
+        self.recorder = SessionRecorder(self.driver, record_to) if record_to else None
+
+    @classmethod
+    def replay(cls, path, parser=None, speed=0.0):
+        """
+        Re-run a recorded scrape without a browser.
+
+        Args:
+            path (str): Session archive written in record_to mode
+            parser (str): Review parser backend, defaults to the fastest one
+            speed (float): Replay the recorded command times scaled by this,
+                0 answers every command at once
+
+        Returns:
+            list: The reviews returned by each recorded get_reviews call
+
+        Raises:
+            ReplayError: The archive's format version is not replayable
+        """
+        archive = SessionArchive.load(path)
+        archive.check_replayable()
+        session = archive.session
+        scraper = cls(parser=parser, capture_network=session['capture_network'],
+                      wait_timeout=session['wait_timeout'],
+                      prune_dom=session.get('prune_dom', False),
+                      driver=ReplayDriver(archive.commands, speed))
+        try:
+            scraper.sort_by(session['url'], session['sort'])
+            # Relative dates are converted as of the recording
+            scraper.scrape_anchor = datetime.fromisoformat(session['anchor'])
+            return [scraper.get_reviews(batch['offset']) for batch in archive.batches]
+        finally:
+            scraper.cleanup()
+
+    def cleanup(self):
+        if self.recorder:
+            self.recorder.finish()
+        super().cleanup()
 
     def sort_by(self, url, ind):
-        self.driver.get(url)
+        self._start_scrape()
+        if self.recorder:
+            self.recorder.start(url=url, sort=ind, parser=self.parser.name,
+                                capture_network=self.capture_network,
+                                wait_timeout=self.wait_timeout,
+                                prune_dom=self.prune_dom,
+                                anchor=self.scrape_anchor.isoformat())
+        return self._run_steps(self._sort_by_steps(url, ind))
+
+    def _sort_by_steps(self, url, ind, navigate=True):
+        """
+        Steps of sort_by, see _run_steps.
+
+        Args:
+            navigate (bool): If False, url is already loaded in the current tab
+        """
+        if navigate:
+            self.driver.get(url)
         self._click_on_cookie_agreement()
 
-        wait = WebDriverWait(self.driver, self.MAX_WAIT)
         clicked = False
         tries = 0
 
         while not clicked and tries < self.MAX_RETRY:
+            # A timed out wait leaves menu_bt None, so click() fails and retries
+            menu_bt = yield Wait('sort_button', EC.element_to_be_clickable(
+                (By.XPATH, '//button[@data-value=\'Sort\']')), self.MAX_WAIT)
             try:
-                menu_bt = wait.until(EC.element_to_be_clickable(
-                    (By.XPATH, '//button[@data-value=\'Sort\']')))
                 menu_bt.click()
                 clicked = True
-                time.sleep(3)
             except Exception:
                 tries += 1
                 self.logger.warning('Failed to click sorting button')
@@ -36,209 +182,188 @@ class GoogleMapsReviewsScraper(GoogleMapsBaseScraper):
         if tries == self.MAX_RETRY:
             return -1
 
-        recent_rating_bt = self.driver.find_elements(
-            By.XPATH, '//div[@role=\'menuitemradio\']')[ind]
-        recent_rating_bt.click()
-        time.sleep(5)
+        menu_items = yield Wait('sort_menu', EC.visibility_of_all_elements_located(
+            (By.XPATH, '//div[@role=\'menuitemradio\']')), self.SORT_TIMEOUT)
+        if not menu_items:
+            menu_items = self.driver.find_elements(
+                By.XPATH, '//div[@role=\'menuitemradio\']')
+
+        old_blocks = self.driver.find_elements(
+            By.CSS_SELECTOR, self.REVIEW_BLOCK_SELECTOR)
+        if self.capture_network:
+            # Only the responses that follow the sort click are in sort order
+            self._read_network_events()
+            self._captured_reviews = []
+            self._pending_responses.clear()
+        menu_items[ind].click()
+
+        # The list is re-rendered in the new order: wait for the old first
+        # review to go away and for a new one to show up
+        if old_blocks:
+            yield Wait('sort_reload', EC.staleness_of(old_blocks[0]), self.SORT_TIMEOUT)
+        yield Wait('sort_reviews', EC.presence_of_element_located(
+            (By.CSS_SELECTOR, self.REVIEW_BLOCK_SELECTOR)), self.SORT_TIMEOUT)
         return 0
 
-    def get_reviews(self, offset):
-        self._scroll()
-        time.sleep(4)
-        self._expand_reviews()
-        self._show_original_reviews()
-        response = BeautifulSoup(self.driver.page_source, 'html.parser')
-        review_blocks = response.find_all(
-            'div', class_='jftiEf fontBodyMedium')
-
-        parsed_reviews = []
-        for index, review in enumerate(review_blocks):
-            if index >= offset:
-                print("index", index)
-                r = self._parse_review(review)
-                parsed_reviews.append(r)
-
-        return parsed_reviews
-
-    def _show_original_reviews(self):
-        translate_buttons = self.driver.find_elements(
-            "xpath", "//button[contains(@class, 'kyuRq') and .//span[contains(text(), 'See original')]]")
-        for button in translate_buttons:
-            self.driver.execute_script("arguments[0].click();", button)
-
-    def _parse_review(self, review):
-        relative_date = self._get_relative_date(review)
-        submitted_at = self._convert_relative_date_to_timestamp(
-            relative_date) if relative_date else datetime.now()
+    def get_account(self, url):
+        """
+        Probe a place: read its header only, without opening the reviews.
+        Far cheaper than a scrape, so it can tell whether one is needed.
 
-        relative_reply_date = self._get_reply_date(review)
-        reply_date = self._convert_relative_date_to_timestamp(
-            relative_reply_date) if relative_reply_date else None
+        Args:
+            url (str): Google Maps URL of the place
 
+        Returns:
+            dict: name, rating (float) and n_reviews (int) of the place,
+                None for what the header does not show
+        """
+        def header_loaded(driver):
+            header = driver.execute_script(self.PLACE_HEADER_JS)
+            return header if header[0] else None
+
+        with PHASE_SECONDS.time(phase='probe'):
+            self.driver.get(url)
+            self._click_on_cookie_agreement()
+            header, _ = self._wait_for('place_header', header_loaded, self.MAX_WAIT)
+        if header is None:
+            raise RuntimeError(f"No place header found at {url}")
+
+        name, summary = header
+        return {'name': name.strip(), **self._parse_place_summary(summary or '')}
+
+    @classmethod
+    def _parse_place_summary(cls, summary):
+        rating = cls.RATING_RE.search(summary)
+        count = cls.REVIEW_COUNT_RE.search(summary)
         return {
-            'id_review': review.get('data-review-id'),
-            'content': self._get_review_text(review),
-            'submitted_at': submitted_at,
-            'rating': self._get_rating(review),
-            'username': review.get('aria-label'),
-            'avatar': self._get_avatar(review),
-            'reply_content': self._get_reply_content(review),
-            'reply_date': reply_date,
-            'n_review_user': self._get_n_reviews(review),
-            'url_user': self._get_user_url(review)
+            'rating': float(rating.group(1).replace(',', '.')) if rating else None,
+            'n_reviews': int(re.sub(r'\D', '', count.group(1))) if count else None,
         }
 
-    def _convert_relative_date_to_timestamp(self, relative_date):
+    def get_reviews(self, offset):
+        return self.parse_raw_batch(self.fetch_raw_batch(offset))
+
+    def fetch_raw_batch(self, offset):
         """
-        Convert Google Maps relative date format to a timestamp.
+        Load the next batch and read it from the page, without parsing it.
 
         Args:
-            relative_date (str): Date in Google Maps format (e.g., "2 days ago", "A month ago")
+            offset (int): Reviews already returned since sort_by
 
         Returns:
-            datetime: Approximate timestamp based on the relative date
+            RawBatch: The reviews from offset onwards, see parse_raw_batch
         """
-        now = datetime.now()
-
-        if not relative_date:
-            return now
-
-        relative_date = relative_date.lower().strip()
-
-        # Just now or very recent
-        if relative_date == "just now" or relative_date == "5 minutes ago" or relative_date == "30 minutes ago":
-            return now
-
-        # Hours ago
-        if "hour" in relative_date:
-            hours = 1
-            if "an hour" not in relative_date:
-                try:
-                    hours = int(re.search(r'(\d+)', relative_date).group(1))
-                except (AttributeError, ValueError):
-                    return now
-            return now - timedelta(hours=hours)
-
-        # Days ago
-        if "day" in relative_date:
-            days = 1
-            if "a day" not in relative_date:
-                try:
-                    days = int(re.search(r'(\d+)', relative_date).group(1))
-                except (AttributeError, ValueError):
-                    return now
-            return now - timedelta(days=days)
-
-        # Weeks ago
-        if "week" in relative_date:
-            weeks = 1
-            if "a week" not in relative_date:
-                try:
-                    weeks = int(re.search(r'(\d+)', relative_date).group(1))
-                except (AttributeError, ValueError):
-                    return now
-            return now - timedelta(weeks=weeks)
-
-        # Months ago
-        if "month" in relative_date:
-            months = 1
-            if "a month" not in relative_date:
-                try:
-                    months = int(re.search(r'(\d+)', relative_date).group(1))
-                except (AttributeError, ValueError):
-                    return now
-            # Approximate a month as 30 days
-            return now - timedelta(days=30*months)
-
-        # Years ago
-        if "year" in relative_date:
-            years = 1
-            if "a year" not in relative_date:
-                try:
-                    years = int(re.search(r'(\d+)', relative_date).group(1))
-                except (AttributeError, ValueError):
-                    return now
-            # Approximate a year as 365 days
-            return now - timedelta(days=365*years)
-
-        return now
+        if self.capture_network:
+            with PHASE_SECONDS.time(phase='network_capture'):
+                raw_reviews = self._get_captured_reviews(offset)
+                if self.prune_dom:
+                    self.driver.execute_script(self.PRUNE_REVIEW_BLOCKS_JS)
+            if self.recorder:
+                self.recorder.add_batch(offset, len(raw_reviews), raw_reviews=raw_reviews)
+            return RawBatch('json', raw_reviews)
+
+        return self._run_steps(self._fetch_raw_batch_steps(offset))
+
+    def _get_reviews_steps(self, offset):
+        """Steps of get_reviews in the DOM mode, see _run_steps."""
+        raw_batch = yield from self._fetch_raw_batch_steps(offset)
+        return self.parse_raw_batch(raw_batch)
+
+    def _fetch_raw_batch_steps(self, offset):
+        """Steps of fetch_raw_batch in the DOM mode."""
+        with PHASE_SECONDS.time(phase='scroll'):
+            n_reviews = self._scroll()
+        yield Wait('scroll', self._more_reviews_loaded(n_reviews), self.wait_timeout)
+        with PHASE_SECONDS.time(phase='expand_reviews'):
+            self._expand_reviews()
+            self._show_original_reviews()
+
+        with PHASE_SECONDS.time(phase='extract'):
+            review_blocks = self._get_new_review_blocks(offset)
+            # Keep the performance log from piling up in chromedriver
+            self._read_network_events()
+        if self.recorder:
+            self.recorder.add_batch(offset, len(review_blocks), review_blocks=review_blocks)
+        return RawBatch('html', review_blocks)
+
+    def _get_captured_reviews(self, offset):
+        """Scroll to trigger the next review page and decode it from the
+        network, returns the raw fields from offset onwards."""
+        n_captured = len(self._captured_reviews)
+        self._scroll()
+
+        def loaded(driver):
+            self._read_network_events()
+            if len(self._captured_reviews) > n_captured:
+                return True
+            _, ended = driver.execute_script(self.REVIEWS_STATE_JS)
+            return ended and not self._pending_responses
+
+        self._wait_for('scroll', loaded, self.wait_timeout)
+        return self._captured_reviews[offset:]
+
+    def _needs_network_events(self):
+        return self.capture_network or super()._needs_network_events()
+
+    def _read_network_events(self):
+        events = super()._read_network_events()
+        if not self.capture_network:
+            return events
+
+        for event in events:
+            params = event.get('params', {})
+            request_id = params.get('requestId')
+            if event['method'] == 'Network.responseReceived':
+                if is_review_response(params.get('response', {}).get('url', '')):
+                    self._pending_responses.add(request_id)
+            elif event['method'] == 'Network.loadingFinished' and request_id in self._pending_responses:
+                self._pending_responses.discard(request_id)
+                self._capture_response(request_id)
+            elif event['method'] == 'Network.loadingFailed':
+                self._pending_responses.discard(request_id)
+        return events
+
+    def _capture_response(self, request_id):
+        try:
+            response = self.driver.execute_cdp_cmd(
+                'Network.getResponseBody', {'requestId': request_id})
+            body = response['body']
+            if response.get('base64Encoded'):
+                body = base64.b64decode(body).decode('utf-8')
+            reviews, _ = decode_reviews_payload(body)
+        except Exception as e:
+            self.logger.warning(f"Failed to decode review response: {e}")
+            return
+        self._captured_reviews.extend(reviews)
+
+    def _get_new_review_blocks(self, offset):
+        """Serialize only the review blocks from offset onwards, in the page,
+        and with prune_dom hollow them in the same round trip."""
+        if self.prune_dom:
+            return self.driver.execute_script(self.PRUNE_NEW_REVIEW_BLOCKS_JS, offset)
+        return self.driver.execute_script(self.NEW_REVIEW_BLOCKS_JS, offset)
+
+    def _show_original_reviews(self):
+        translate_buttons = self.driver.find_elements(
+            "xpath", "//button[contains(@class, 'kyuRq') and .//span[contains(text(), 'See original')]]")
+        for button in translate_buttons:
+            self.driver.execute_script("arguments[0].click();", button)
 
     def _scroll(self):
+        """Scroll the review pane to the bottom and return the current review count."""
         scrollable_div = self.driver.find_element(
-            By.CSS_SELECTOR, 'div.m6QErb.DxyBCb.kA9KIf.dS8AEf')
-        self.driver.execute_script(
-            'arguments[0].scrollTop = arguments[0].scrollHeight',
-            scrollable_div
-        )
+            By.CSS_SELECTOR, self.SCROLLABLE_SELECTOR)
+        return self.driver.execute_script(self.SCROLL_JS, scrollable_div)
+
+    def _more_reviews_loaded(self, n_reviews):
+        """Condition: more than n_reviews are loaded or the list has ended."""
+        def loaded(driver):
+            count, ended = driver.execute_script(self.REVIEWS_STATE_JS)
+            return count > n_reviews or ended
+        return loaded
 
     def _expand_reviews(self):
         buttons = self.driver.find_elements(
             By.CSS_SELECTOR, 'button.w8nwRe.kyuRq')
         for button in buttons:
             self.driver.execute_script("arguments[0].click();", button)
-
-    # Helper methods for parsing review elements
-    def _get_review_text(self, review):
-        try:
-            return self._filter_string(
-                review.find('span', class_='wiI7pd').text
-            )
-        except:
-            return None
-
-    def _get_relative_date(self, review):
-        try:
-            return review.find('span', class_='rsqaWe').text
-        except:
-            return None
-
-    def _get_reply_content(self, review):
-        try:
-            reply_div = review.find('div', class_='wiI7pd', lang='el')
-            if reply_div and reply_div.parent.find('span', class_='nM6d2c'):
-                return reply_div.text.strip()
-            return None
-        except:
-            return None
-
-    def _get_reply_date(self, review):
-        try:
-            date_span = review.find('span', class_='DZSIDd')
-            if date_span:
-                return date_span.text.strip()
-            return None
-        except:
-            return None
-
-    def _get_avatar(self, review):
-        try:
-            avatar_img = review.find('img', class_='NBa7we')
-            if avatar_img:
-                img_src = avatar_img['src']
-                img_src_cleaned = img_src.rsplit('=', 1)[0]
-                return img_src_cleaned
-
-            return None
-        except:
-            return None
-
-    def _get_rating(self, review):
-        try:
-            return float(
-                review.find('span', class_='kvMYJc')[
-                    'aria-label'].split(' ')[0]
-            )
-        except:
-            return None
-
-    def _get_n_reviews(self, review):
-        try:
-            return review.find('div', class_='RfnDt').text.split(' ')[3]
-        except:
-            return 0
-
-    def _get_user_url(self, review):
-        try:
-            return review.find('button', class_='WEBjve')['data-href']
-        except:
-            return None
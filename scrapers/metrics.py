@@ -0,0 +1,174 @@
+# metrics.py
+"""In-process metrics, rendered in the Prometheus text exposition format.
+
+Metrics are per process: every gunicorn worker serves its own at /metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a single DevTools round trip to a long scroll wait or scrape
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.type}']
+        for name, labels, value in self._samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value)
+                for key, value in items]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per bucket counts, then the sum and count of all observations
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        samples = []
+        for key, state in items:
+            bounds = [_format_value(float(bound)) for bound in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, state[:-2] + [state[-1]]):
+                samples.append((f'{self.name}_bucket', _format_labels(
+                    self.labelnames, key, [('le', bound)]), count))
+            samples.append((f'{self.name}_sum', _format_labels(self.labelnames, key), state[-2]))
+            samples.append((f'{self.name}_count', _format_labels(self.labelnames, key), state[-1]))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        """All metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+# Scraper metrics, shared by the scrapers, ReviewsFetcher and the app
+PHASE_SECONDS = Histogram(
+    'gm_scraper_phase_seconds', 'Time spent in each phase of a scrape.', ['phase'])
+REVIEWS_TOTAL = Counter(
+    'gm_reviews_scraped_total', 'Reviews returned by ReviewsFetcher.')
+BATCHES_TOTAL = Counter(
+    'gm_review_batches_total', 'Review batches requested from a scraper.', ['result'])
+RETRIES_TOTAL = Counter(
+    'gm_scrape_retries_total', 'Failed attempts that were retried.', ['operation'])
+PLACES_UNCHANGED_TOTAL = Counter(
+    'gm_places_unchanged_total', 'Scrapes skipped because the review count had not changed.')
+DRIVER_RESTARTS_TOTAL = Counter(
+    'gm_driver_restarts_total', 'Scrapers replaced by a fresh browser after an error.')
+LIVE_DRIVERS = Gauge(
+    'gm_chrome_processes', 'Chrome browser sessions currently running.')
@@ -0,0 +1,119 @@
+# relative_dates.py
+"""Conversion of Google Maps relative dates ("3 weeks ago", "πριν από 2 μήνες")
+to timestamps.
+
+Maps only says how many whole units ago something happened, so "a month ago"
+means anywhere from one to two months before the scrape. Every conversion
+returns the estimate together with that window.
+"""
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+RelativeDate = namedtuple('RelativeDate', ['estimate', 'earliest', 'latest'])
+
+UNITS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    # Approximate a month as 30 days and a year as 365 days
+    'month': timedelta(days=30),
+    'year': timedelta(days=365),
+}
+
+# Per locale: words for "one", unit words and phrases meaning "now"
+LOCALES = {
+    'en': {
+        'one': ['a', 'an', 'one'],
+        'units': {
+            'minute': ['minute', 'minutes', 'min', 'mins'],
+            'hour': ['hour', 'hours'],
+            'day': ['day', 'days'],
+            'week': ['week', 'weeks'],
+            'month': ['month', 'months'],
+            'year': ['year', 'years'],
+        },
+        'now': ['just now', 'moments ago', 'a moment ago'],
+    },
+    'el': {
+        'one': ['ένα', 'έναν', 'μία', 'μια', 'ενός', 'μίας'],
+        'units': {
+            'minute': ['λεπτό', 'λεπτά'],
+            'hour': ['ώρα', 'ώρες'],
+            'day': ['ημέρα', 'ημέρες', 'μέρα', 'μέρες'],
+            'week': ['εβδομάδα', 'εβδομάδες'],
+            'month': ['μήνα', 'μήνας', 'μήνες'],
+            'year': ['χρόνο', 'χρόνος', 'χρόνια', 'έτος', 'έτη'],
+        },
+        'now': ['μόλις τώρα', 'τώρα'],
+    },
+}
+
+
+def _alternation(words):
+    return '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+def _compile(locale):
+    unit_words = {word: unit for unit, words in locale['units'].items() for word in words}
+    pattern = re.compile(
+        r'(?<!\w)(?P<count>\d+|%s)\s+(?P<unit>%s)(?!\w)' % (
+            _alternation(locale['one']), _alternation(unit_words)))
+    return pattern, unit_words, tuple(locale['now'])
+
+
+_COMPILED = {name: _compile(locale) for name, locale in LOCALES.items()}
+
+
+@lru_cache(maxsize=1024)
+def parse_phrase(relative_date):
+    """
+    Parse a relative date phrase, memoized since most phrases repeat.
+
+    Args:
+        relative_date (str): e.g. "a month ago", "Edited 3 days ago"
+
+    Returns:
+        tuple: (unit, count), or None if the phrase is not understood
+    """
+    phrase = relative_date.lower().strip()
+    for pattern, unit_words, now_phrases in _COMPILED.values():
+        if phrase in now_phrases:
+            return 'minute', 0
+        match = pattern.search(phrase)
+        if match:
+            count = match.group('count')
+            return unit_words[match.group('unit')], int(count) if count.isdigit() else 1
+    return None
+
+
+def convert_relative_date(relative_date, anchor):
+    """
+    Convert one relative date against the scrape-time anchor.
+
+    Returns:
+        RelativeDate: Estimate and window, or None if the phrase is not understood
+    """
+    parsed = parse_phrase(relative_date) if relative_date else None
+    if parsed is None:
+        return None
+    unit, count = parsed
+    estimate = anchor - count * UNITS[unit]
+    return RelativeDate(estimate, estimate - UNITS[unit], estimate)
+
+
+def convert_relative_dates(relative_dates, anchor=None):
+    """
+    Convert a batch of relative dates against a single anchor.
+
+    Args:
+        relative_dates (list): Phrases, None entries are allowed
+        anchor (datetime): When the phrases were read, defaults to now
+
+    Returns:
+        list: A RelativeDate or None per phrase
+    """
+    anchor = anchor or datetime.now()
+    return [convert_relative_date(relative_date, anchor) for relative_date in relative_dates]
@@ -0,0 +1,302 @@
+# review_parsers.py
+import logging
+from collections import namedtuple
+from datetime import datetime
+from bs4 import BeautifulSoup
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    etree = None
+    lxml_html = None
+from .metrics import PHASE_SECONDS
+from .relative_dates import convert_relative_dates
+
+logger = logging.getLogger('googlemaps-scraper')
+
+# What a scraper's fetch_raw_batch read for one batch, before parsing:
+# format 'html' for the outerHTML of each review block, 'json' for the raw
+# fields of each review decoded from a review page response
+RawBatch = namedtuple('RawBatch', ['format', 'data'])
+
+
+def _filter_string(str_value):
+    return str_value.replace('\r', ' ').replace('\n', ' ').replace('\t', ' ')
+
+
+class ReviewFieldsMixin:
+    """Turns the raw fields returned by a parser backend or a decoded payload
+    into the review dicts returned by a scraper's get_reviews."""
+    # Set by sort_by, every relative date of a scrape is converted against it
+    scrape_anchor = None
+
+    def _start_scrape(self):
+        self.scrape_anchor = datetime.now()
+
+    def parse_raw_batch(self, raw_batch):
+        """
+        Parse a batch read by fetch_raw_batch. Uses no browser, so it may run
+        in another thread while the next batch is fetched.
+
+        Args:
+            raw_batch (RawBatch): The batch, html batches need self.parser
+
+        Returns:
+            list: The review dicts, as returned by get_reviews
+        """
+        with PHASE_SECONDS.time(phase='parse'):
+            raw_reviews = raw_batch.data
+            if raw_batch.format == 'html':
+                raw_reviews = self.parser.parse(raw_batch.data)
+            return self._parse_reviews(raw_reviews)
+
+    def _parse_reviews(self, raw_reviews):
+        """Parse a batch of raw fields against the scrape-time anchor."""
+        anchor = self.scrape_anchor or datetime.now()
+        submitted = convert_relative_dates(
+            [fields['relative_date'] for fields in raw_reviews], anchor)
+        replied = convert_relative_dates(
+            [fields['relative_reply_date'] for fields in raw_reviews], anchor)
+        return [self._parse_review(fields, anchor, submitted_at, reply_date)
+                for fields, submitted_at, reply_date in zip(raw_reviews, submitted, replied)]
+
+    def _parse_review(self, fields, anchor, submitted_at, reply_date):
+        # Missing or unknown phrases are estimated as the anchor itself
+        reply_anchor = anchor if fields['relative_reply_date'] else None
+
+        return {
+            'id_review': fields['id_review'],
+            'content': fields['content'],
+            'submitted_at': submitted_at.estimate if submitted_at else anchor,
+            'submitted_at_window': (submitted_at.earliest, submitted_at.latest) if submitted_at else None,
+            'rating': fields['rating'],
+            'username': fields['username'],
+            'avatar': fields['avatar'],
+            'reply_content': fields['reply_content'],
+            'reply_date': reply_date.estimate if reply_date else reply_anchor,
+            'reply_date_window': (reply_date.earliest, reply_date.latest) if reply_date else None,
+            'n_review_user': fields['n_review_user'],
+            'url_user': fields['url_user']
+        }
+
+
+class BeautifulSoupReviewParser:
+    """Pure-Python backend, always available."""
+    name = 'bs4'
+
+    def parse(self, review_blocks):
+        """
+        Extract the raw fields of every review block in a batch.
+
+        Args:
+            review_blocks (list): outerHTML of each review block
+
+        Returns:
+            list: One dict of raw fields per block, relative dates unconverted
+        """
+        response = BeautifulSoup(''.join(review_blocks), 'html.parser')
+        return [self.parse_block(review)
+                for review in response.find_all('div', recursive=False)]
+
+    def parse_block(self, review):
+        return {
+            'id_review': review.get('data-review-id'),
+            'content': self._get_review_text(review),
+            'relative_date': self._get_relative_date(review),
+            'rating': self._get_rating(review),
+            'username': review.get('aria-label'),
+            'avatar': self._get_avatar(review),
+            'reply_content': self._get_reply_content(review),
+            'relative_reply_date': self._get_reply_date(review),
+            'n_review_user': self._get_n_reviews(review),
+            'url_user': self._get_user_url(review)
+        }
+
+    def _get_review_text(self, review):
+        try:
+            return _filter_string(
+                review.find('span', class_='wiI7pd').text
+            )
+        except:
+            return None
+
+    def _get_relative_date(self, review):
+        try:
+            return review.find('span', class_='rsqaWe').text
+        except:
+            return None
+
+    def _get_reply_content(self, review):
+        try:
+            reply_div = review.find('div', class_='wiI7pd', lang='el')
+            if reply_div and reply_div.parent.find('span', class_='nM6d2c'):
+                return reply_div.text.strip()
+            return None
+        except:
+            return None
+
+    def _get_reply_date(self, review):
+        try:
+            date_span = review.find('span', class_='DZSIDd')
+            if date_span:
+                return date_span.text.strip()
+            return None
+        except:
+            return None
+
+    def _get_avatar(self, review):
+        try:
+            avatar_img = review.find('img', class_='NBa7we')
+            if avatar_img:
+                img_src = avatar_img['src']
+                img_src_cleaned = img_src.rsplit('=', 1)[0]
+                return img_src_cleaned
+
+            return None
+        except:
+            return None
+
+    def _get_rating(self, review):
+        try:
+            return float(
+                review.find('span', class_='kvMYJc')[
+                    'aria-label'].split(' ')[0]
+            )
+        except:
+            return None
+
+    def _get_n_reviews(self, review):
+        try:
+            return review.find('div', class_='RfnDt').text.split(' ')[3]
+        except:
+            return 0
+
+    def _get_user_url(self, review):
+        try:
+            return review.find('button', class_='WEBjve')['data-href']
+        except:
+            return None
+
+
+def _class_xpath(tag, cls, extra=''):
+    return etree.XPath(
+        f".//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {cls} '){extra}]")
+
+
+class LxmlReviewParser:
+    """Fast backend: one libxml2 parse per batch and precompiled XPath selectors.
+
+    Produces exactly the same dicts as BeautifulSoupReviewParser.
+    """
+    name = 'lxml'
+
+    def __init__(self):
+        self._review_text = _class_xpath('span', 'wiI7pd')
+        self._relative_date = _class_xpath('span', 'rsqaWe')
+        self._reply_div = _class_xpath('div', 'wiI7pd', " and @lang='el'")
+        self._reply_marker = _class_xpath('span', 'nM6d2c')
+        self._reply_date = _class_xpath('span', 'DZSIDd')
+        self._avatar = _class_xpath('img', 'NBa7we')
+        self._rating = _class_xpath('span', 'kvMYJc')
+        self._n_reviews = _class_xpath('div', 'RfnDt')
+        self._user_url = _class_xpath('button', 'WEBjve')
+
+    def parse(self, review_blocks):
+        """
+        Extract the raw fields of every review block in a batch.
+
+        Args:
+            review_blocks (list): outerHTML of each review block
+
+        Returns:
+            list: One dict of raw fields per block, relative dates unconverted
+        """
+        if not review_blocks:
+            return []
+        blocks = lxml_html.fragments_fromstring(''.join(review_blocks))
+        return [self.parse_block(review) for review in blocks
+                if isinstance(review, lxml_html.HtmlElement) and review.tag == 'div']
+
+    def parse_block(self, review):
+        review_text = self._first(self._review_text, review)
+        relative_date = self._first(self._relative_date, review)
+        reply_date = self._first(self._reply_date, review)
+        n_reviews = self._first(self._n_reviews, review)
+
+        return {
+            'id_review': review.get('data-review-id'),
+            'content': _filter_string(review_text.text_content())
+            if review_text is not None else None,
+            'relative_date': relative_date.text_content()
+            if relative_date is not None else None,
+            'rating': self._get_rating(review),
+            'username': review.get('aria-label'),
+            'avatar': self._get_avatar(review),
+            'reply_content': self._get_reply_content(review),
+            'relative_reply_date': reply_date.text_content().strip()
+            if reply_date is not None else None,
+            'n_review_user': self._get_n_reviews(n_reviews),
+            'url_user': self._get_attribute(self._user_url, review, 'data-href')
+        }
+
+    @staticmethod
+    def _first(xpath, review):
+        found = xpath(review)
+        return found[0] if found else None
+
+    def _get_attribute(self, xpath, review, attribute):
+        element = self._first(xpath, review)
+        return element.get(attribute) if element is not None else None
+
+    def _get_reply_content(self, review):
+        reply_div = self._first(self._reply_div, review)
+        if reply_div is None:
+            return None
+        parent = reply_div.getparent()
+        if parent is None or not self._reply_marker(parent):
+            return None
+        return reply_div.text_content().strip()
+
+    def _get_avatar(self, review):
+        img_src = self._get_attribute(self._avatar, review, 'src')
+        return img_src.rsplit('=', 1)[0] if img_src is not None else None
+
+    def _get_rating(self, review):
+        label = self._get_attribute(self._rating, review, 'aria-label')
+        try:
+            return float(label.split(' ')[0])
+        except (AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def _get_n_reviews(element):
+        if element is None:
+            return 0
+        parts = element.text_content().split(' ')
+        return parts[3] if len(parts) > 3 else 0
+
+
+REVIEW_PARSERS = {
+    BeautifulSoupReviewParser.name: BeautifulSoupReviewParser,
+    LxmlReviewParser.name: LxmlReviewParser,
+}
+
+
+def get_review_parser(name=None):
+    """
+    Build a review parser backend.
+
+    Args:
+        name (str): 'lxml', 'bs4' or None for the fastest available backend
+
+    Returns:
+        A parser with a parse(review_blocks) method
+    """
+    if name is None:
+        name = LxmlReviewParser.name if lxml_html is not None else BeautifulSoupReviewParser.name
+    if name not in REVIEW_PARSERS:
+        raise ValueError(f"Unknown review parser: {name}")
+    if name == LxmlReviewParser.name and lxml_html is None:
+        logger.warning("lxml is not installed, falling back to BeautifulSoup")
+        name = BeautifulSoupReviewParser.name
+    return REVIEW_PARSERS[name]()
@@ -0,0 +1,140 @@
+# review_payloads.py
+"""Decoding of the paginated review responses behind the Maps review pane.
+
+The pane loads reviews from listugcposts as an XSSI-guarded, deeply nested
+JSON array. FIELD_PATHS maps every field the DOM parsers extract to its
+position in one review entry, so a decoded entry has exactly the keys and
+value types of a parser's raw dict.
+
+FIELD_PATHS and the page paths are unverified: no real listugcposts response
+is committed to check them against. The stand-in server's payloads are
+built by encode_reviews_payload, the inverse of decode_review, so the
+offline decode-equals-DOM check only shows the two are consistent with each
+other. Before relying on capture_network or the http backend, record a live
+session and compare its decoded reviews with the DOM parse.
+"""
+import json
+
+XSSI_PREFIX = ")]}'"
+
+# URL fragments of the responses that carry review pages
+REVIEW_RPC_PATTERNS = (
+    '/maps/rpc/listugcposts',
+    '/maps/preview/review/listentitiesreviews',
+)
+
+# Position of the next-page token and of the review list in a response
+NEXT_PAGE_TOKEN_PATH = (1,)
+REVIEWS_PATH = (2,)
+
+# Position of each field inside one review entry
+FIELD_PATHS = {
+    'id_review': (0, 0),
+    'username': (0, 1, 4, 5, 0),
+    'avatar': (0, 1, 4, 5, 1),
+    'url_user': (0, 1, 4, 5, 2, 0),
+    'n_review_user': (0, 1, 4, 5, 5),
+    'relative_date': (0, 1, 6),
+    'rating': (0, 2, 0, 0),
+    'content': (0, 2, 15, 0, 0),
+    'relative_reply_date': (0, 3, 3),
+    'reply_content': (0, 3, 14, 0, 0),
+}
+
+
+def _filter_string(str_value):
+    return str_value.replace('\r', ' ').replace('\n', ' ').replace('\t', ' ')
+
+
+def _dig(value, path):
+    for index in path:
+        try:
+            value = value[index]
+        except (IndexError, KeyError, TypeError):
+            return None
+    return value
+
+
+def _put(target, path, value):
+    for position, index in enumerate(path):
+        while len(target) <= index:
+            target.append(None)
+        if position == len(path) - 1:
+            target[index] = value
+        else:
+            if target[index] is None:
+                target[index] = []
+            target = target[index]
+
+
+def is_review_response(url):
+    return any(pattern in url for pattern in REVIEW_RPC_PATTERNS)
+
+
+def decode_review(entry):
+    """Raw review fields of one entry, as the DOM parsers would return them."""
+    content = _dig(entry, FIELD_PATHS['content'])
+    avatar = _dig(entry, FIELD_PATHS['avatar'])
+    rating = _dig(entry, FIELD_PATHS['rating'])
+    n_reviews = _dig(entry, FIELD_PATHS['n_review_user'])
+    reply_content = _dig(entry, FIELD_PATHS['reply_content'])
+    reply_date = _dig(entry, FIELD_PATHS['relative_reply_date'])
+
+    return {
+        'id_review': _dig(entry, FIELD_PATHS['id_review']),
+        'content': _filter_string(content) if content is not None else None,
+        'relative_date': _dig(entry, FIELD_PATHS['relative_date']),
+        'rating': float(rating) if rating is not None else None,
+        'username': _dig(entry, FIELD_PATHS['username']),
+        'avatar': avatar.rsplit('=', 1)[0] if avatar else None,
+        'reply_content': reply_content.strip() if reply_content is not None else None,
+        'relative_reply_date': reply_date.strip() if reply_date is not None else None,
+        'n_review_user': str(n_reviews) if n_reviews is not None else 0,
+        'url_user': _dig(entry, FIELD_PATHS['url_user']),
+    }
+
+
+def decode_reviews_payload(body):
+    """
+    Decode one review page response.
+
+    Args:
+        body (str): Response body, with or without the XSSI prefix
+
+    Returns:
+        tuple: (list of raw review field dicts, next page token or None)
+    """
+    if body.startswith(XSSI_PREFIX):
+        body = body[len(XSSI_PREFIX):]
+    payload = json.loads(body)
+
+    entries = _dig(payload, REVIEWS_PATH) or []
+    return ([decode_review(entry) for entry in entries],
+            _dig(payload, NEXT_PAGE_TOKEN_PATH))
+
+
+def encode_reviews_payload(reviews, next_page_token=None, avatar_suffix='=w36-h36-p-rp-mo-br100'):
+    """
+    Build a review page response from raw review fields, the inverse of
+    decode_reviews_payload. Used by the local stand-in server.
+    """
+    entries = []
+    for fields in reviews:
+        entry = []
+        for name, path in FIELD_PATHS.items():
+            value = fields.get(name)
+            if value is None:
+                continue
+            if name == 'avatar':
+                value += avatar_suffix
+            elif name == 'n_review_user':
+                if not value:
+                    continue
+                value = int(value) if str(value).isdigit() else value
+            _put(entry, path, value)
+        entries.append(entry)
+
+    payload = []
+    _put(payload, NEXT_PAGE_TOKEN_PATH, next_page_token)
+    _put(payload, REVIEWS_PATH, entries)
+    return XSSI_PREFIX + '\n' + json.dumps(payload, ensure_ascii=False)
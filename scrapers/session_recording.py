@@ -0,0 +1,246 @@
+# session_recording.py
+"""Recording of scrape sessions, and their replay without a browser.
+
+A session archive is a zip file with:
+
+    session.json      url, sort order and scraper settings of the session,
+                      and the archive's format_version
+    commands.jsonl    every WebDriver command issued, with its response and
+                      the seconds it took, and how many times each named wait
+                      polled its condition
+    batches/NNNN.*    what each get_reviews call parsed: the review blocks
+                      (.html, one per line) or the decoded raw fields (.json)
+
+ReplayDriver answers the recorded commands in order, so a scraper built on
+it runs the same get_reviews/_parse_review code as the live session. Waits
+poll as many times as they did while recording instead of for a duration,
+which keeps the replay in step with the recording however fast it runs.
+The scraper has to issue the same commands it did while recording, so
+FORMAT_VERSION is bumped whenever that sequence changes and archives of
+another version are refused.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+import zipfile
+from collections import defaultdict, deque
+from datetime import datetime
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver.remote.webdriver import WebDriver as RemoteWebDriver
+
+logger = logging.getLogger('googlemaps-scraper')
+
+# Version of the recorded command sequence. 1: archives without a version,
+# waiting for the cookie banner; 2: the banner is looked up once
+FORMAT_VERSION = 2
+
+# Commands that may be sent after the recording ended, e.g. on cleanup
+_TEARDOWN_COMMANDS = {'close', 'quit', 'deleteSession'}
+
+
+class ReplayError(RuntimeError):
+    pass
+
+
+class SessionArchive:
+    def __init__(self, session, commands, batches):
+        self.session = session
+        self.commands = commands
+        self.batches = batches
+
+    @property
+    def format_version(self):
+        return self.session.get('format_version', 1)
+
+    def check_replayable(self):
+        """
+        Raises:
+            ReplayError: The archive was recorded by a scraper issuing
+                another command sequence
+        """
+        if self.format_version != FORMAT_VERSION:
+            raise ReplayError(
+                f"Session archive format version {self.format_version} cannot be "
+                f"replayed by this scraper (version {FORMAT_VERSION}), record it again")
+
+    @property
+    def n_reviews(self):
+        return sum(batch['n_reviews'] for batch in self.batches)
+
+    def save(self, path):
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('session.json', json.dumps(
+                dict(self.session, batches=[
+                    {key: value for key, value in batch.items() if key != 'snapshot'}
+                    for batch in self.batches]), indent=2))
+            archive.writestr('commands.jsonl', ''.join(
+                json.dumps(command) + '\n' for command in self.commands))
+            for index, batch in enumerate(self.batches):
+                archive.writestr(f"batches/{index:04d}.{batch['format']}", batch['snapshot'])
+
+    @classmethod
+    def load(cls, path):
+        with zipfile.ZipFile(path) as archive:
+            session = json.loads(archive.read('session.json'))
+            commands = [json.loads(line) for line in
+                        archive.read('commands.jsonl').decode('utf-8').splitlines()]
+            batches = session.pop('batches')
+            for index, batch in enumerate(batches):
+                batch['snapshot'] = archive.read(
+                    f"batches/{index:04d}.{batch['format']}").decode('utf-8')
+        return cls(session, commands, batches)
+
+    def review_blocks(self, index):
+        """Review blocks of a DOM batch, in the parsers' input format."""
+        snapshot = self.batches[index]['snapshot']
+        return snapshot.split('\n') if snapshot else []
+
+    def raw_reviews(self, index):
+        """Decoded raw fields of a network capture batch."""
+        return json.loads(self.batches[index]['snapshot'])
+
+
+class SessionRecorder:
+    """Records the commands a driver sends between start() and finish()."""
+
+    def __init__(self, driver, directory):
+        """
+        Args:
+            driver (WebDriver): Driver to record
+            directory (str): Where session archives are written
+        """
+        self.directory = directory
+        self.last_archive_path = None
+        self._archive = None
+        os.makedirs(directory, exist_ok=True)
+
+        executor = driver.command_executor
+        execute = executor.execute
+
+        def recording_execute(command, params):
+            start = time.perf_counter()
+            response = execute(command, params)
+            if self._archive is not None:
+                # Serialized right away: the driver swaps element references
+                # in the response for WebElement objects afterwards
+                self._archive.commands.append({
+                    'command': command,
+                    'params': json.loads(json.dumps(params, default=str)),
+                    'response': json.loads(json.dumps(response, default=str)),
+                    'elapsed': round(time.perf_counter() - start, 6),
+                })
+            return response
+
+        executor.execute = recording_execute
+
+    def start(self, **session):
+        """Begin a new session archive, saving the previous one."""
+        self.finish()
+        self._archive = SessionArchive(
+            dict(session, format_version=FORMAT_VERSION,
+                 recorded_at=datetime.now().isoformat()), [], [])
+
+    def add_wait(self, name, polls):
+        if self._archive is not None:
+            self._archive.commands.append({'wait': name, 'polls': polls})
+
+    def add_batch(self, offset, n_reviews, review_blocks=None, raw_reviews=None):
+        if self._archive is None:
+            return
+        if raw_reviews is not None:
+            batch_format, snapshot = 'json', json.dumps(raw_reviews, ensure_ascii=False)
+        else:
+            batch_format, snapshot = 'html', '\n'.join(review_blocks or [])
+        self._archive.batches.append({
+            'offset': offset,
+            'n_reviews': n_reviews,
+            'n_commands': len(self._archive.commands),
+            'format': batch_format,
+            'snapshot': snapshot,
+        })
+
+    def finish(self):
+        """Write the current session archive, if any."""
+        archive, self._archive = self._archive, None
+        if archive is None:
+            return None
+        path = os.path.join(
+            self.directory,
+            f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.zip")
+        try:
+            archive.save(path)
+        except Exception as e:
+            logger.error(f"Failed to save session recording: {e}")
+            return None
+        self.last_archive_path = path
+        logger.info(f"Saved session recording with {len(archive.commands)} commands to {path}")
+        return path
+
+
+class ReplayCommandExecutor:
+    """Answers WebDriver commands from a recording, in recorded order per
+    command name. speed scales the recorded command times, 0 answers at once."""
+
+    def __init__(self, commands, speed=0.0):
+        self.speed = speed
+        self.n_executed = 0
+        self._responses = defaultdict(deque)
+        for command in commands:
+            if 'command' in command:
+                self._responses[command['command']].append(command)
+
+    def execute(self, command, params):
+        if command == 'newSession':
+            return {'value': {'sessionId': 'replay', 'capabilities': {'browserName': 'chrome'}}}
+
+        queue = self._responses.get(command)
+        if not queue:
+            if command in _TEARDOWN_COMMANDS:
+                return {'value': None}
+            raise ReplayError(f"The recording has no more responses for '{command}'")
+
+        recorded = queue.popleft()
+        self.n_executed += 1
+        if self.speed:
+            time.sleep(recorded['elapsed'] * self.speed)
+        return json.loads(json.dumps(recorded['response']))
+
+    def close(self):
+        pass
+
+
+class ReplayDriver(RemoteWebDriver):
+    """WebDriver that replays a recorded session instead of driving Chrome."""
+
+    def __init__(self, commands, speed=0.0):
+        self._waits = deque(command for command in commands if 'wait' in command)
+        super().__init__(command_executor=ReplayCommandExecutor(commands, speed),
+                         options=ChromeOptions())
+
+    def replay_wait(self, name, condition):
+        """
+        Poll condition as many times as the recorded wait did.
+
+        Returns:
+            The condition result, or None if the recorded wait timed out
+        """
+        if not self._waits:
+            raise ReplayError(f"The recording has no more waits, got '{name}'")
+        recorded = self._waits.popleft()
+        if recorded['wait'] != name:
+            raise ReplayError(f"Expected wait '{recorded['wait']}', got '{name}'")
+
+        for _ in range(recorded['polls']):
+            try:
+                result = condition(self)
+            except NoSuchElementException:
+                result = None
+            if result:
+                return result
+        return None
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self.execute('executeCdpCommand', {'cmd': cmd, 'params': cmd_args})['value']
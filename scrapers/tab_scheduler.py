@@ -0,0 +1,174 @@
+# tab_scheduler.py
+"""Several place scrapes at once, as tabs of a single browser.
+
+Each tab runs the scraper's step generators (_sort_by_steps,
+_get_reviews_steps). Where a blocking scrape would sit in _wait_for, the
+scheduler polls the tab's condition once and moves on to the next tab, so
+one tab's commands run while the others wait on the network.
+"""
+import logging
+import time
+from collections import deque
+from selenium.common.exceptions import WebDriverException
+from .google_maps_base_scraper import Wait
+from .metrics import PHASE_SECONDS
+
+logger = logging.getLogger('googlemaps-scraper')
+
+# The document being left is marked before navigating, so the page_load wait
+# cannot be satisfied by it while the new one is still on its way
+NAVIGATE_JS = 'document.gmPreviousDocument = true; window.location.href = arguments[0];'
+PAGE_LOADED_JS = (
+    'return document.readyState === "complete" && !document.gmPreviousDocument'
+    ' && location.href !== "about:blank";')
+
+
+class _Tab:
+    def __init__(self, url, handle, steps):
+        self.url = url
+        self.handle = handle
+        self.steps = steps
+        # The Wait the tab is blocked on, None until its first step ran
+        self.wait = None
+        self.deadline = None
+        self.start = time.monotonic()
+
+
+class TabScheduler:
+    def __init__(self, scraper, max_tabs=4):
+        """
+        Args:
+            scraper (GoogleMapsReviewsScraper): Scraper whose browser hosts
+                the tabs, in the DOM mode and not recording
+            max_tabs (int): Places scraped at the same time
+        """
+        if scraper.capture_network or scraper.recorder:
+            # The performance log and the recorded commands are per browser,
+            # they cannot be told apart by tab
+            raise ValueError("TabScheduler needs a scraper without capture_network or record_to")
+        self.scraper = scraper
+        self.driver = scraper.driver
+        self.max_tabs = max_tabs
+
+    def scrape(self, urls, sort_by=1, max_reviews=100):
+        """
+        Scrape the reviews of several places, max_tabs of them at a time.
+
+        Args:
+            urls (Iterable[str]): Google Maps URLs to scrape
+            sort_by (int): Sort menu index, see SortBy
+            max_reviews (int): Maximum number of reviews per place
+
+        Returns:
+            dict: Per url the list of review dicts, like get_reviews returns
+                them, or the exception its tab failed with
+        """
+        pending = deque(urls)
+        tabs = []
+        results = {}
+        origin = self.driver.current_window_handle
+        # Relative dates of all tabs are converted as of the same moment
+        self.scraper._start_scrape()
+
+        try:
+            while pending or tabs:
+                while pending and len(tabs) < self.max_tabs:
+                    tabs.append(self._open_tab(pending.popleft(), sort_by, max_reviews))
+
+                progressed = False
+                for tab in list(tabs):
+                    try:
+                        progressed |= self._advance(tab)
+                    except StopIteration as stop:
+                        results[tab.url] = stop.value
+                    except Exception as e:
+                        logger.error(f"Tab scrape of {tab.url} failed: {e}")
+                        results[tab.url] = e
+                    else:
+                        continue
+                    PHASE_SECONDS.observe(time.monotonic() - tab.start, phase='tab_scrape')
+                    tabs.remove(tab)
+                    self._close_tab(tab)
+                    progressed = True
+
+                if not progressed:
+                    time.sleep(self.scraper.POLL_INTERVAL)
+        finally:
+            for tab in tabs:
+                self._close_tab(tab)
+            self.driver.switch_to.window(origin)
+        return results
+
+    def _open_tab(self, url, sort_by, max_reviews):
+        self.driver.switch_to.new_window('tab')
+        # Resource blocking was set up in the first tab only
+        self.scraper._setup_network(self.driver)
+        return _Tab(url, self.driver.current_window_handle,
+                    self._tab_steps(url, sort_by, max_reviews))
+
+    def _close_tab(self, tab):
+        try:
+            self.driver.switch_to.window(tab.handle)
+            self.driver.close()
+        except Exception as e:
+            logger.warning(f"Failed to close the tab of {tab.url}: {e}")
+
+    def _advance(self, tab):
+        """
+        Poll the tab's wait once and run its next step if the wait is over.
+
+        Returns:
+            bool: True if a step ran
+
+        Raises:
+            StopIteration: The tab finished, with its reviews as value
+        """
+        self.driver.switch_to.window(tab.handle)
+        result = None
+        if tab.wait is not None:
+            try:
+                result = tab.wait.condition(self.driver)
+            except WebDriverException as e:
+                # Also a script that ran while the document was unloading,
+                # the tab is not ready yet
+                logger.debug(f"Wait '{tab.wait.name}' poll failed in the tab of {tab.url}: {e}")
+                result = None
+            if not result and time.monotonic() < tab.deadline:
+                return False
+            if not result:
+                logger.debug(f"Wait '{tab.wait.name}' timed out in the tab of {tab.url}")
+        tab.wait = tab.steps.send(result or None)
+        tab.deadline = time.monotonic() + tab.wait.timeout
+        return True
+
+    def _tab_steps(self, url, sort_by, max_reviews):
+        """Load, sort and scroll one place, returns its review dicts."""
+        scraper = self.scraper
+        # driver.get would block every tab until this page loaded
+        self.driver.execute_script(NAVIGATE_JS, url)
+        yield Wait('page_load', lambda driver: driver.execute_script(PAGE_LOADED_JS),
+                   scraper.MAX_WAIT)
+
+        error = yield from scraper._sort_by_steps(url, sort_by, navigate=False)
+        if error != 0:
+            raise RuntimeError(f"Failed to sort reviews: {error}")
+
+        reviews = []
+        seen_reviews = set()
+        offset = 0
+        while len(reviews) < max_reviews:
+            batch = yield from scraper._get_reviews_steps(offset)
+            if not batch:
+                break
+            offset += len(batch)
+            for review in batch:
+                # Same rules as ReviewsFetcher.iter_reviews
+                review_key = review['id_review'] or hash((review['content'], review['username']))
+                if review_key in seen_reviews:
+                    return reviews
+                if review['content'] is not None:
+                    seen_reviews.add(review_key)
+                    reviews.append(review)
+                    if len(reviews) >= max_reviews:
+                        break
+        return reviews
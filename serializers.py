@@ -0,0 +1,89 @@
+# serializers.py
+import json
+from datetime import date
+from typing import Callable, Iterable, List, Optional, Sequence
+from werkzeug.http import http_date
+
+# API field name -> Review attribute
+REVIEW_FIELDS = {
+    'id': 'id_review',
+    'content': 'content',
+    'submitted_at': 'submitted_at',
+    'submitted_at_window': 'submitted_at_window',
+    'rating': 'rating',
+    'username': 'username',
+    'avatar': 'avatar',
+    'reply_content': 'reply_content',
+    'reply_date': 'reply_date',
+    'reply_date_window': 'reply_date_window',
+    'n_review_user': 'n_review_user',
+    'url_user': 'url_user',
+}
+
+
+def parse_fields(fields_param: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a comma separated fields= projection.
+
+    Returns:
+        Optional[List[str]]: API field names, or None for every field
+
+    Raises:
+        ValueError: If a field is unknown
+    """
+    if not fields_param:
+        return None
+    fields = [field.strip() for field in fields_param.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in REVIEW_FIELDS]
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(unknown)}. Valid fields are {', '.join(REVIEW_FIELDS)}")
+    return fields
+
+
+def review_to_dict(review, fields: Optional[Sequence[str]] = None) -> dict:
+    return {field: getattr(review, REVIEW_FIELDS[field])
+            for field in (fields or REVIEW_FIELDS)}
+
+
+def json_default(o):
+    # Same encoding as Flask's JSON provider, so responses do not change
+    if isinstance(o, date):
+        return http_date(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_json(obj) -> str:
+    """obj encoded the way jsonify does outside debug mode, without the
+    trailing newline: sorted keys, compact separators."""
+    return json.dumps(obj, default=json_default, sort_keys=True, separators=(',', ':'))
+
+
+def dumps_review(review, fields: Optional[Sequence[str]] = None) -> str:
+    return dumps_json(review_to_dict(review, fields))
+
+
+def dumps_reviews_response(reviews: Iterable,
+                           fields: Optional[Sequence[str]] = None,
+                           dumps: Callable = dumps_review) -> str:
+    """
+    JSON body of a fetch-reviews response, with every review serialized once.
+
+    The encoded review is reused in both the reviews and review_with_text
+    lists instead of building and encoding a dict per list.
+    """
+    encoded = []
+    encoded_with_text = []
+    for review in reviews:
+        review_json = dumps(review, fields)
+        encoded.append(review_json)
+        if review.content is not None:
+            encoded_with_text.append(review_json)
+
+    # The bytes jsonify would produce: sorted keys, compact separators
+    return ''.join([
+        '{"review_with_text":[', ','.join(encoded_with_text),
+        '],"reviews":[', ','.join(encoded),
+        '],"success":true,"total_review_with_text":', str(len(encoded_with_text)),
+        ',"total_reviews":', str(len(encoded)), '}\n',
+    ])